@@ -1,12 +1,14 @@
-from pygal import colors
+from datavis import svg
+from datavis.model import PollutionModel
 from datavis.preprocess import handle_pre_processing
-from datavis.utils import get_filename, get_leading_party, get_party_color, get_party_name, is_leading_in_government, sort_by_popularity
+from datavis.storage import FORMATS, load_data
+from datavis.utils import get_filename, get_leading_party, get_party_color, get_party_name, is_leading_in_government, positive_int, sort_by_popularity
 import argparse
+import hashlib
 import json
+from multiprocessing import Pool
 import os
-import pygal
-from pygal.style import Style
-import statistics
+from types import SimpleNamespace
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -23,6 +25,33 @@ def parse_arguments():
     parser.add_argument('-po', '--processing-output',
         help="Directory for pre-processing results.",
         default='data/processed')
+    parser.add_argument('-f', '--force-processing',
+        help="Pre-process the data even if the input files did not change since the last run.",
+        action='store_true')
+    parser.add_argument('-sd', '--station-data-dir',
+        help="Path to directory containing hourly or daily CSV measurements of air pollution stations, used instead of the yearly pollution data. Expected naming scheme for a file: 'PM10_NAME.csv'.",
+        default=None)
+    parser.add_argument('-cs', '--chunk-size',
+        help="Number of station measurements read at once.",
+        type=int, default=1000000)
+    parser.add_argument('-md', '--merged-data',
+        help="Additionally write the merged pollution data of all years to a CSV file in the pre-processing directory.",
+        action='store_true')
+    parser.add_argument('-R', '--renderer',
+        help="Library rendering the charts: 'svg' (built-in, fast) or 'pygal' (requires pygal).",
+        choices=['svg', 'pygal'], default='svg')
+    parser.add_argument('-r', '--rebuild',
+        help="Build all charts, also those whose data did not change since the last build.",
+        action='store_true')
+    parser.add_argument('-df', '--data-format',
+        help="Format of the pre-processing results. 'npz' is a compact binary format, 'json' human-readable.",
+        choices=list(FORMATS.keys()), default='json')
+    parser.add_argument('-dj', '--debug-json',
+        help="Additionally write binary pre-processing results as JSON for debugging.",
+        action='store_true')
+    parser.add_argument('-j', '--jobs',
+        help="Number of processes parsing input files and rendering charts in parallel. All CPUs if unset.",
+        type=positive_int, default=None)
 
     subparsers = parser.add_subparsers()
 
@@ -72,213 +101,283 @@ def parse_arguments():
     return parser.parse_args()
 
 
-def get_yearly_air_pollution_of_all_states(data_file_path):
-    result = {}
-    fields_of_interest = ['year_average', 'days_above_limit', 'days_above_limit_cleaned']
-    with open(data_file_path) as datafile:
-        data = json.load(datafile)
-        for state in data.keys():
-            for year in data[state]:
-                if year not in result:
-                    result[year] = {}
-                for field in fields_of_interest:
-                    result[year][field] = result[year].get(field, []) + \
-                        [data[state][year]['pollution'][field] / data[state][year]['pollution'][field+'_counter']]
-    return result
-
-
-def get_nation_median_air_pollution(data_file_path):
-    result = {}
-    data = get_yearly_air_pollution_of_all_states(data_file_path)
-    
-    # calulcate median
-    for year in data:
-        if year not in result:
-            result[year] = {}
-        for field in data[year]:
-            result[year][field] = statistics.median(data[year].get(field, [0]))
-    
-    return result
+def get_nation_median_air_pollution(pollution_model):
+    return pollution_model.to_yearly_dict(pollution_model.get_nation_median)
 
 
-def get_nation_median_air_pollution_change(data_file_path):
-    result = {}
-    data = get_yearly_air_pollution_of_all_states(data_file_path)
-    
-    # calulcate median
-    last_year_pollutions = data[min(data.keys())]
-    for year in data:
-        if year not in result:
-            result[year] = {}
-        for field in data[year]:
-            result[year][field] = statistics.median(
-                [this_year-last_year for this_year, last_year in zip(
-                    data[year].get(field, [0]), last_year_pollutions.get(field, [0]))])
-        last_year_pollutions = data[year]
+def get_nation_median_air_pollution_change(pollution_model):
+    return pollution_model.to_yearly_dict(pollution_model.get_nation_median_change)
+
+
+def get_absolute_value(current_value, prev_value):
+    return current_value
+
+
+def get_change_value(current_value, prev_value):
+    return current_value - prev_value
+
+
+CHART_TYPES = {
+    'absolute': {
+        'title': "Average of PM10 values in {}",
+        'y_title': "Yearly change of PM10 concentration in µg/m³",
+        'get_value': get_absolute_value,
+        'get_nation_values': get_nation_median_air_pollution,
+    },
+    'change': {
+        'title': "Average change of PM10 values in {}",
+        'y_title': "Yearly change of PM10 concentration in µg/m³",
+        'get_value': get_change_value,
+        'get_nation_values': get_nation_median_air_pollution_change,
+    },
+}
+
+
+def get_renderer(renderer):
+    """Returns the module providing the chart classes `Line`, `Box` and `Style`. pygal is only imported if requested."""
+    if renderer == 'pygal':
+        import pygal
+        from pygal.style import Style
+        return SimpleNamespace(Line=pygal.Line, Box=pygal.Box, Style=Style)
+    return svg
+
+
+def run_job(job):
+    function, arguments = job
+    return function(*arguments)
+
+
+def run_jobs(jobs, processes=None):
+    """Runs (function, arguments) jobs in parallel by a pool of `processes` worker processes (all CPUs if None).
+
+    Functions and arguments must be picklable, i.e. functions defined at module level.
+    """
+    if processes == 1 or len(jobs) <= 1:
+        for job in jobs:
+            run_job(job)
+        return
+
+    with Pool(processes) as pool:
+        for _ in pool.imap_unordered(run_job, jobs):
+            pass
+
+
+CHART_HASHES_FILENAME = '.chart_hashes.json'
+CHART_VERSION = 1  # increase on changes of the chart layout to rebuild all charts
+
+
+def get_job_hash(job):
+    """Returns a hash of a chart job's function and its input arguments, the output path excluded."""
+    function, arguments = job
+    key = json.dumps([CHART_VERSION, function.__name__, arguments[:-1]], ensure_ascii=False, default=str)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def load_chart_hashes(output_dir):
+    hashes_file_path = os.path.join(output_dir, CHART_HASHES_FILENAME)
+    if not os.path.isfile(hashes_file_path):
+        return {}
+    with open(hashes_file_path) as hashes_file:
+        return json.load(hashes_file)
+
+
+def save_chart_hashes(hashes):
+    for output_dir, chart_hashes in hashes.items():
+        with open(os.path.join(output_dir, CHART_HASHES_FILENAME), "w") as hashes_file:
+            json.dump(chart_hashes, hashes_file, indent=4, ensure_ascii=False)
+
+
+def get_changed_jobs(jobs, rebuild=False):
+    """Returns the chart jobs whose output file is missing or was built from different inputs, and the hashes of all jobs.
+
+    The output file path is expected as last argument of a job. Hashes are returned per output directory and file name.
+    """
+    changed_jobs = []
+    hashes = {}
+    for job in jobs:
+        output_dir, filename = os.path.split(job[1][-1])
+        if output_dir not in hashes:
+            hashes[output_dir] = load_chart_hashes(output_dir)
+        job_hash = get_job_hash(job)
+        if rebuild or not os.path.isfile(job[1][-1]) or not hashes[output_dir].get(filename) == job_hash:
+            changed_jobs.append(job)
+        hashes[output_dir][filename] = job_hash
+    return changed_jobs, hashes
+
 
-    return result
+def build_charts(jobs, processes=None, rebuild=False):
+    """Runs the chart jobs (see `run_jobs()`) whose input changed since the last build."""
+    changed_jobs, hashes = get_changed_jobs(jobs, rebuild)
+    if len(changed_jobs) < len(jobs):
+        print("Skipping {} of {} charts with unchanged data.".format(len(jobs) - len(changed_jobs), len(jobs)))
+    run_jobs(changed_jobs, processes)
+    save_chart_hashes(hashes)
+
+
+def build_state_chart(chart_type, state, state_data, state_averages, nation_graph, renderer, output_file_path):
+    charts = get_renderer(renderer)
+    chart_options = CHART_TYPES[chart_type]
+    chart = charts.Line(dots_size=1)
+    chart.y_title = chart_options['y_title']
+    chart.title = chart_options['title'].format(state)
+    chart.x_labels = sorted(state_data.keys())[1:]
+    
+    year_counter = -1
+    last_year_pollution = None
+    graph_data = {}
+    last_election = {}
+    previous_leading_party = None
+    for year, year_state_average in state_averages.items():
+        dataset = state_data[year]
+        if not dataset['election'] == {}:
+            last_election = dataset['election']
+        if last_year_pollution is not None:
+            leading_party = get_leading_party(last_election)
+            if leading_party not in graph_data:
+                graph_data[leading_party] = [None] * year_counter
+            year_value = chart_options['get_value'](year_state_average, last_year_pollution)
+            graph_data[leading_party].append(year_value)
+            has_leading_party_changed = not leading_party == previous_leading_party and previous_leading_party is not None
+            for party in graph_data.keys():
+                if party == leading_party:
+                    continue
+                if has_leading_party_changed:
+                    graph_data[previous_leading_party].append(year_value)
+                else:
+                    graph_data[party].append(None)
+            previous_leading_party = leading_party
+        last_year_pollution = year_state_average
+        year_counter += 1
+    
+    party_colors = []
+    for party, values in graph_data.items():
+        party_colors.append(get_party_color(party))
+        chart.add('{} {}'.format(get_party_name(party), state), values, allow_interruptions=True)
+    if nation_graph is not None:
+        party_colors.append(get_party_color('nation'))
+        chart.add('Nation Average', [ds['year_average'] for ds in nation_graph.values()][1:])
+    chart.style = charts.Style(colors=party_colors)
+    chart.render_to_file(output_file_path)
 
 
-def build_average_charts(data_file_path, output_dir, show_average, callback_build_chart, callback_title, callback_new_value, callback_nation_value):
+def get_average_chart_jobs(data, pollution_model, output_dir, show_average, chart_type, renderer='svg'):
+    """Returns the jobs building the chart of every state (see `run_jobs()`)."""
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    if show_average:
-        nation_graph = callback_nation_value(data_file_path)
+    nation_graph = CHART_TYPES[chart_type]['get_nation_values'](pollution_model) if show_average else None
 
     output_basename = os.path.join(output_dir, 'pollution.svg')
-    with open(data_file_path) as datafile:
-        data = json.load(datafile)
-        for state in data.keys():
-            chart = callback_build_chart()
-            chart.title = callback_title(state)
-            chart.x_labels = sorted(data[state].keys())[1:]
-            
-            year_counter = -1
-            last_year_pollution = None
-            graph_data = {}
-            last_election = {}
-            previous_leading_party = None
-            for dataset in data[state].values():
-                pollution = dataset['pollution']
-                if not dataset['election'] == {}:
-                    last_election = dataset['election']
-                year_state_average = pollution.get('year_average', 0) / pollution.get('year_average_counter', 1)
-                if last_year_pollution is not None:
-                    leading_party = get_leading_party(last_election)
-                    if leading_party not in graph_data:
-                        graph_data[leading_party] = [None] * year_counter
-                    year_value = callback_new_value(year_state_average, last_year_pollution)
-                    graph_data[leading_party].append(year_value)
-                    has_leading_party_changed = not leading_party == previous_leading_party and previous_leading_party is not None
-                    for party in graph_data.keys():
-                        if party == leading_party:
-                            continue
-                        if has_leading_party_changed:
-                            graph_data[previous_leading_party].append(year_value)
-                        else:
-                            graph_data[party].append(None)
-                    previous_leading_party = leading_party
-                last_year_pollution = year_state_average
-                year_counter += 1
-            
-            party_colors = []
-            for party, values in graph_data.items():
-                party_colors.append(get_party_color(party))
-                chart.add('{} {}'.format(get_party_name(party), state), values, allow_interruptions=True)
-            if show_average:
-                party_colors.append(get_party_color('nation'))
-                chart.add('Nation Average', [ds['year_average'] for ds in nation_graph.values()][1:])
-            chart.style = Style(colors=party_colors)
-            chart.render_to_file(get_filename(output_basename, '_'+state))
+    return [
+        (build_state_chart, (chart_type, state, data[state], pollution_model.get_state_averages(state), nation_graph, renderer, get_filename(output_basename, '_'+state)))
+        for state in data.keys()
+    ]
+
+
+def build_average_charts(data_file_path, output_dir, show_average, chart_type, processes=None, rebuild=False, renderer='svg'):
+    data = load_data(data_file_path)
+    build_charts(get_average_chart_jobs(data, PollutionModel(data), output_dir, show_average, chart_type, renderer), processes, rebuild)
 
     print("Charts created. Files are available under:\n{}".format(
-        os.path.abspath(get_filename(output_basename, '_STATE'))))
+        os.path.abspath(get_filename(os.path.join(output_dir, 'pollution.svg'), '_STATE'))))
     
     return output_dir
 
 
 def build_absolute_charts(data_file_path, output_dir, **kwargs):
-    def build_chart():
-        chart = pygal.Line(dots_size=1)
-        chart.y_title = "Yearly change of PM10 concentration in µg/m³"
-        return chart
-
     print("Creating absolute charts...")
-    build_average_charts(
-        data_file_path,
-        output_dir,
-        kwargs['average'],
-        build_chart,
-        lambda state: "Average of PM10 values in "+state,
-        lambda current_value, prev_value: current_value,
-        get_nation_median_air_pollution)
+    build_average_charts(data_file_path, output_dir, kwargs['average'], 'absolute', kwargs.get('jobs'), kwargs.get('rebuild'), kwargs.get('renderer', 'svg'))
     return output_dir
 
 
 def build_change_charts(data_file_path, output_dir, **kwargs):
-    def build_chart():
-        chart = pygal.Line(dots_size=1)
-        chart.y_title = "Yearly change of PM10 concentration in µg/m³"
-        return chart
-    
     print("Creating change charts...")
-    build_average_charts(
-        data_file_path,
-        output_dir,
-        kwargs['average'],
-        build_chart,
-        lambda state: "Average change of PM10 values in "+state,
-        lambda current_value, prev_value: current_value - prev_value,
-        get_nation_median_air_pollution_change)
+    build_average_charts(data_file_path, output_dir, kwargs['average'], 'change', kwargs.get('jobs'), kwargs.get('rebuild'), kwargs.get('renderer', 'svg'))
     return output_dir
 
 
-def build_party_impact_chart(data_file_path, output_dir, **kwargs):
-    def build_chart():
-        chart = pygal.Box()
-        chart.title = "Parties' Impact on Air Pollution"
-        chart.x_title = "Nation-wide yearly average changes of air pollution values in \
-            years in which the respective party is part of the government (alternative row: in which party is leading the government)."  # abuse x axis as description
-        chart.y_title = "Yearly change of PM10 concentration in µg/m³"
-        return chart
-    
-    print("Creating party impact chart...")
-    
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
+def get_party_impact_data(data, pollution_model):
+    """Returns the yearly state-wide changes of air pollution per party, in years the party was part of and leading the government."""
     party_data = {
         'part': {},
         'leading' : {}
     }
 
     # aggregate values per party
-    with open(data_file_path) as jsonfile:
-        data = json.load(jsonfile)
-        for state in data:
-            last_year = min(data[state].keys())
-            election = {}
-            for year in data[state]:                    
-                dataset = data[state][year]['pollution']
-                prev_dataset = data[state][last_year]['pollution']
-                relative_pollution_change = dataset.get('year_average', 0) / dataset.get('year_average_counter', 1) - \
-                    prev_dataset.get('year_average', 0) / prev_dataset.get('year_average_counter', 1)
-                if abs(relative_pollution_change) > 50:
-                    print(state, year, relative_pollution_change)
-                
-                election_candidate = data[state][year].get('election', {})
-                if not election_candidate == {}:
-                    election = election_candidate
-
-                for party in election.get('government', []):                    
-                    if is_leading_in_government(party, election):
-                        party_data['leading'][party] = party_data['leading'].get(party, []) + [relative_pollution_change]
-                    party_data['part'][party] = party_data['part'].get(party, []) + [relative_pollution_change]
-
-                last_year = year
-        
-        chart = build_chart()
-        party_colors = []
-        for party, values in sort_by_popularity(party_data['part']):
-            chart.add(get_party_name(party), [{'value': value, 'label': '{} years in government'.format(len(values))} for value in values])
-            chart.add(get_party_name(party) + ' (leading)', [{'value': value, 'label': '{} years in government'.format(len(party_data['leading'].get(party, [])))} for value in party_data['leading'].get(party, [])])
-            party_colors.append(get_party_color(party))
-            party_colors.append(get_party_color(party, 0.4))
-        chart.style = Style(colors=party_colors)
-    
-    output_file_path = os.path.join(output_dir, 'pollution_impact_all_parties.svg')
+    for state in data:
+        state_averages = pollution_model.get_state_averages(state)
+        last_year = min(state_averages.keys())
+        election = {}
+        for year, year_state_average in state_averages.items():
+            relative_pollution_change = year_state_average - state_averages[last_year]
+            if abs(relative_pollution_change) > 50:
+                print(state, year, relative_pollution_change)
+            
+            election_candidate = data[state][year].get('election', {})
+            if not election_candidate == {}:
+                election = election_candidate
+
+            for party in election.get('government', []):                    
+                if is_leading_in_government(party, election):
+                    party_data['leading'][party] = party_data['leading'].get(party, []) + [relative_pollution_change]
+                party_data['part'][party] = party_data['part'].get(party, []) + [relative_pollution_change]
+
+            last_year = year
+
+    return party_data
+
+
+def build_impact_chart(party_data, renderer, output_file_path):
+    charts = get_renderer(renderer)
+    chart = charts.Box()
+    chart.title = "Parties' Impact on Air Pollution"
+    chart.x_title = "Nation-wide yearly average changes of air pollution values in \
+        years in which the respective party is part of the government (alternative row: in which party is leading the government)."  # abuse x axis as description
+    chart.y_title = "Yearly change of PM10 concentration in µg/m³"
+
+    party_colors = []
+    for party, values in sort_by_popularity(party_data['part']):
+        chart.add(get_party_name(party), [{'value': value, 'label': '{} years in government'.format(len(values))} for value in values])
+        chart.add(get_party_name(party) + ' (leading)', [{'value': value, 'label': '{} years in government'.format(len(party_data['leading'].get(party, [])))} for value in party_data['leading'].get(party, [])])
+        party_colors.append(get_party_color(party))
+        party_colors.append(get_party_color(party, 0.4))
+    chart.style = charts.Style(colors=party_colors)
     chart.render_to_file(output_file_path)
+
+
+def get_party_impact_jobs(data, pollution_model, output_dir, renderer='svg'):
+    """Returns the job building the party impact chart (see `run_jobs()`)."""
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    output_file_path = os.path.join(output_dir, 'pollution_impact_all_parties.svg')
+    return [(build_impact_chart, (get_party_impact_data(data, pollution_model), renderer, output_file_path))]
+
+
+def build_party_impact_chart(data_file_path, output_dir, **kwargs):
+    print("Creating party impact chart...")
+    data = load_data(data_file_path)
+    build_charts(get_party_impact_jobs(data, PollutionModel(data), output_dir, kwargs.get('renderer', 'svg')), kwargs.get('jobs'), kwargs.get('rebuild'))
+
     print("Chart created. File is available under:\n{}".format(
-        os.path.abspath(output_file_path)))
+        os.path.abspath(os.path.join(output_dir, 'pollution_impact_all_parties.svg'))))
 
     return output_dir
 
 
 def build_all_charts(data_file_path, output_dirs, **kwargs):
-    build_absolute_charts(data_file_path, output_dirs[0], **kwargs)
-    build_change_charts(data_file_path, output_dirs[1], **kwargs)
-    build_party_impact_chart(data_file_path, output_dirs[2])
+    print("Creating all charts...")
+    data = load_data(data_file_path)
+    pollution_model = PollutionModel(data)
+    build_charts(
+        get_average_chart_jobs(data, pollution_model, output_dirs[0], kwargs['average'], 'absolute', kwargs['renderer']) +
+        get_average_chart_jobs(data, pollution_model, output_dirs[1], kwargs['average'], 'change', kwargs['renderer']) +
+        get_party_impact_jobs(data, pollution_model, output_dirs[2], kwargs['renderer']),
+        kwargs.get('jobs'),
+        kwargs.get('rebuild'))
+
+    print("Charts created. Files are available under:\n{}".format(
+        '\n'.join(os.path.abspath(output_dir) for output_dir in output_dirs)))
 
 
 def main():
@@ -288,7 +387,14 @@ def main():
         args.pollution_data_dir,
         args.election_data_dir,
         args.government_data_file,
-        args.processing_output)
+        args.processing_output,
+        force=args.force_processing,
+        keep_merged_data=args.merged_data,
+        station_data_dir=args.station_data_dir,
+        chunk_size=args.chunk_size,
+        data_format=args.data_format,
+        debug_json=args.debug_json,
+        jobs=args.jobs)
 
     args.func(data_file_path, args.output, **vars(args))
 
@@ -0,0 +1,67 @@
+import numpy as np
+from datavis.storage import load_data
+
+FIELDS = ['year_average', 'days_above_limit', 'days_above_limit_cleaned']
+
+
+class PollutionModel:
+    """Yearly air pollution averages of all states, loaded once from the processed data.
+
+    Every field of `FIELDS` is stored as array with one row per state (see `states`) and one column per year
+    (see `years`, sorted). Years without data of a state are NaN.
+    """
+
+    def __init__(self, data):
+        """
+        Parameters
+        ----------
+        data
+            Processed data as created by `handle_pre_processing()`: `{state: {year: {'pollution': {...}, ...}}}`.
+        """
+        self.states = list(data.keys())
+        self.years = sorted({year for state in data for year in data[state]})
+        year_indices = {year: index for index, year in enumerate(self.years)}
+
+        shape = (len(self.states), len(self.years))
+        sums = {field: np.zeros(shape) for field in FIELDS}
+        counters = {field: np.zeros(shape) for field in FIELDS}
+        for state_index, state in enumerate(self.states):
+            for year, dataset in data[state].items():
+                pollution = dataset['pollution']
+                for field in FIELDS:
+                    sums[field][state_index, year_indices[year]] = pollution[field]
+                    counters[field][state_index, year_indices[year]] = pollution[field+'_counter']
+
+        # a counter of 0 marks a missing year
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.averages = {field: sums[field] / counters[field] for field in FIELDS}
+
+    @classmethod
+    def from_file(cls, data_file_path):
+        return cls(load_data(data_file_path))
+
+    def get_state_averages(self, state, field='year_average'):
+        """Returns `{year: average}` of a state for all years with data, sorted by year."""
+        averages = self.averages[field][self.states.index(state)]
+        return {year: float(average) for year, average in zip(self.years, averages) if not np.isnan(average)}
+
+    def get_changes(self, field='year_average'):
+        """Returns the change of every state's average relative to its previous year. The first year has no change (0)."""
+        values = self.averages[field]
+        return np.diff(values, axis=1, prepend=values[:, :1])
+
+    def get_nation_median(self, field='year_average'):
+        """Returns the median over all states per year, ignoring states without data in a year."""
+        return np.nanmedian(self.averages[field], axis=0)
+
+    def get_nation_median_change(self, field='year_average'):
+        """Returns the median of the states' changes relative to their previous year (see `get_changes()`)."""
+        return np.nanmedian(self.get_changes(field), axis=0)
+
+    def to_yearly_dict(self, get_values):
+        """Returns `{year: {field: value}}` with the values of `get_values(field)` for every field."""
+        values = {field: get_values(field) for field in FIELDS}
+        return {
+            year: {field: float(values[field][year_index]) for field in FIELDS}
+            for year_index, year in enumerate(self.years)
+        }
@@ -1,8 +1,21 @@
-from datavis.utils import get_basename, get_filename, get_state, get_year, is_date, is_end_of_data, is_no_state_assigned, set_extension
+from datavis.storage import FORMATS, load_data, save_data
+from datavis.utils import get_basename, get_filename, get_state, get_year, is_date, is_end_of_data, is_no_state_assigned, positive_int, set_extension
 import argparse
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 import csv
+import hashlib
 import json
+from multiprocessing import Pool
 import os
+import shutil
+
+POLLUTION_FIELDS = ['state', 'station_code', 'station_name', 'station_surrounding', 'station_kind', 'year_average', 'days_above_limit', 'days_above_limit_cleaned']
+FIELDS_TO_AGGREGATE = ['year_average', 'days_above_limit', 'days_above_limit_cleaned']
+
+CACHE_VERSION = 1
+CACHE_FILENAME = 'cache.json'
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -16,84 +29,218 @@ def parse_arguments():
     parser.add_argument('-o', '--output',
         help="Directory for pre-processing results.",
         default='')
+    parser.add_argument('-sd', '--station-data-dir',
+        help="Path to directory containing hourly or daily CSV measurements of air pollution stations, used instead of the yearly pollution data. Expected naming scheme for a file: PM10_NAME.")
+    parser.add_argument('-m', '--merged-data',
+        help="Additionally write the merged pollution data of all years to a CSV file.",
+        action='store_true')
+    parser.add_argument('-df', '--data-format',
+        help="Format of the pre-processing results.",
+        choices=list(FORMATS.keys()), default='json')
+    parser.add_argument('-dj', '--debug-json',
+        help="Additionally write binary pre-processing results as JSON.",
+        action='store_true')
+    parser.add_argument('-j', '--jobs',
+        help="Number of processes parsing input files in parallel. All CPUs if unset.",
+        type=positive_int, default=None)
+    parser.add_argument('-f', '--force',
+        help="Pre-process even if the input files did not change since the last run.",
+        action='store_true')
     
     return parser.parse_args()
 
 
-def merge_pollution_data(files, merge_file_path):
-    print("Merging air pollution data...")
-    with open(set_extension(merge_file_path, '.csv'), mode="w", encoding="utf-8") as output:
-        data = []
-        for file in files:
-            year = file[-8:-4]
-            with open(file) as input:
-                input.readline()  # skip header
-                for line in input:
-                    if is_no_state_assigned(line):
-                        continue
-                    if is_end_of_data(line):
-                        break
-                    data.append("{};{}".format(year,line))
-        
-        output.write('\ufeff')  # encode as BOM, see https://stackoverflow.com/questions/5202648/adding-bom-unicode-signature-while-saving-file-in-python/5202815
-        output.write("year;state;station_code;station_name;station_surrounding;station_kind;year_average;days_above_limit;days_above_limit_cleaned\n")
-        output.writelines(data)
+def get_data_files(data_dir, filename_base):
+    """Returns the sorted paths of all files in a directory matching the filename base (see `get_basename()`)."""
+    return sorted(
+        [os.path.join(data_dir, file)
+            for file in os.listdir(data_dir)
+            if get_basename(file) == filename_base and
+                os.path.isfile(os.path.join(data_dir, file))
+        ]
+    )
+
+
+def get_fingerprint(files, options=None):
+    """Returns a hash of the paths, sizes, modification times and contents of the given files and of the options."""
+    fingerprint = hashlib.sha1(json.dumps([CACHE_VERSION, options], sort_keys=True).encode('utf-8'))
+    for file in sorted(files):
+        stat = os.stat(file)
+        fingerprint.update('{};{};{}\n'.format(os.path.abspath(file), stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+        with open(file, 'rb') as input:
+            for block in iter(lambda: input.read(2**20), b''):
+                fingerprint.update(block)
+    return fingerprint.hexdigest()
+
+
+def get_cached_result(processing_output_dir, fingerprint):
+    """Returns the path of the pre-processing result if it was created from inputs with the given fingerprint, else None."""
+    cache_file_path = os.path.join(processing_output_dir, CACHE_FILENAME)
+    if not os.path.isfile(cache_file_path):
+        return None
+    with open(cache_file_path) as cache_file:
+        cache = json.load(cache_file)
+    result_file_path = os.path.join(processing_output_dir, cache.get('result', ''))
+    if not cache.get('fingerprint') == fingerprint or not os.path.isfile(result_file_path):
+        return None
+    return result_file_path
+
+
+def set_cached_result(processing_output_dir, fingerprint, result_file_path):
+    with open(os.path.join(processing_output_dir, CACHE_FILENAME), "w") as cache_file:
+        json.dump({
+            'fingerprint': fingerprint,
+            'result': os.path.relpath(result_file_path, processing_output_dir),
+        }, cache_file, indent=4)
+
+
+def map_files(function, jobs, pool=None):
+    """Applies the function to every job, in parallel if a process pool is given. Results keep the order of the jobs."""
+    if pool is None:
+        return [function(job) for job in jobs]
+    return pool.map(function, jobs)
+
+
+def read_pollution_lines(file):
+    """Yields the data lines of a yearly pollution file lazily. Skips the header, lines not assigned to a state and the footer."""
+    with open(file) as input:
+        input.readline()  # skip header
+        for line in input:
+            if is_no_state_assigned(line):
+                continue
+            if is_end_of_data(line):
+                break
+            yield line
+
+
+def write_lines(lines, output, prefix=''):
+    """Yields the given lines while writing them to output, each preceded by prefix."""
+    for line in lines:
+        output.write(prefix + line)
+        yield line
+
+
+def add_pollution_row(data, year, row):
+    """Adds the values of a parsed pollution line (see `POLLUTION_FIELDS`) to the sums and counters of its state and year."""
+    row = dict(zip(POLLUTION_FIELDS, row))
+    if not row['state'] in data:
+        data[row['state']] = {}
+    if not year in data[row['state']]:
+        data[row['state']][year] = {}
+    dataset = data[row['state']][year]
+    for field in FIELDS_TO_AGGREGATE:
+        value = 0
+        if row.get(field) is not None and not row[field] == '-':
+            value = row[field].replace(',', '.')
+        dataset[field] = dataset.get(field, 0) + float(value)
+        dataset[field+'_counter'] = dataset.get(field+'_counter', 0) + 1
+
+
+def aggregate_pollution_file(job):
+    """Aggregates a yearly pollution file per state and year (see `add_pollution_row()`).
+
+    Parameters
+    ----------
+    job
+        Tuple (path of the file, path of a file the data lines are additionally written to or None).
+    """
+    file, part_file_path = job
+    year = file[-8:-4]
+    data = {}
+    with open(part_file_path, mode="w", encoding="utf-8") if part_file_path is not None else nullcontext() as part_file:
+        lines = read_pollution_lines(file)
+        if part_file is not None:
+            lines = write_lines(lines, part_file, year + ';')
+        for row in csv.reader(lines, delimiter=';'):
+            add_pollution_row(data, year, row)
+    return data
+
+
+def add_pollution_data(data, partial_data):
+    """Adds the sums and counters of partially aggregated pollution data to data."""
+    for state, state_data in partial_data.items():
+        for year, partial_dataset in state_data.items():
+            dataset = data.setdefault(state, {}).setdefault(year, {})
+            for field, value in partial_dataset.items():
+                dataset[field] = dataset.get(field, 0) + value
+
+
+def aggregate_pollution_data(files, output_file_path, merge_file_path=None, data_format='json', debug_json=False, pool=None):
+    """Aggregates the yearly pollution files per state and year in a single pass and writes the result.
+
+    Every file is aggregated on its own, in parallel if a process pool is given. The partial results are added up in
+    the order of the files, so the result does not depend on the number of processes.
+
+    Parameters
+    ----------
+    files
+        Paths of the yearly pollution files. The year is taken from the filename (`FS-10_YYYY.csv`).
+
+    output_file_path
+        Path of the aggregated data.
 
+    merge_file_path
+        If set, the data lines of all files are additionally written to this CSV file, preceded by their year.
 
-def reformat_pollution_data(file, output_file_path):
+    data_format, debug_json
+        See `save_data()`.
+
+    Returns
+    -------
+    Path of the aggregated data.
+    """
     print("Processing air pollution data...")
-    with open(file, newline='') as csvfile:
-        reader = csv.DictReader(csvfile, delimiter=';')
-        data = {}
-        with open(set_extension(output_file_path, '.json'), "w", newline="") as output:
-            for row in reader:
-                row['year'] = row['\ufeffyear']  # BOM encoding is read as field name
-                if not row['state'] in data:
-                    data[row['state']] = {}
-                if not row['year'] in data[row['state']]:
-                    data[row['state']][row['year']] = {}
-                dataset = data[row['state']][row['year']]
-                fields_to_aggregate = ['year_average', 'days_above_limit', 'days_above_limit_cleaned']
-                for field in fields_to_aggregate:
-                    value = 0
-                    if row[field] is not None and not row[field] == '-':
-                        value = row[field].replace(',', '.')
-                    dataset[field] = dataset.get(field, 0) + float(value)
-                    dataset[field+'_counter'] = dataset.get(field+'_counter', 0) + 1
-            
-            json.dump(data, output, indent=4, ensure_ascii=False)
+    part_file_paths = [None] * len(files)
+    if merge_file_path is not None:
+        merge_file_path = set_extension(merge_file_path, '.csv')
+        part_file_paths = ['{}.part{}'.format(merge_file_path, index) for index in range(len(files))]
+
+    data = {}
+    try:
+        for partial_data in map_files(aggregate_pollution_file, list(zip(files, part_file_paths)), pool):
+            add_pollution_data(data, partial_data)
+
+        if merge_file_path is not None:
+            with open(merge_file_path, mode="w", encoding="utf-8") as merge_file:
+                merge_file.write('\ufeff')  # encode as BOM, see https://stackoverflow.com/questions/5202648/adding-bom-unicode-signature-while-saving-file-in-python/5202815
+                merge_file.write("year;" + ";".join(POLLUTION_FIELDS) + "\n")
+                for part_file_path in part_file_paths:
+                    with open(part_file_path, encoding="utf-8") as part_file:
+                        shutil.copyfileobj(part_file, merge_file)
+    finally:
+        # also remove the parts of failed runs
+        for part_file_path in part_file_paths:
+            if part_file_path is not None and os.path.isfile(part_file_path):
+                os.remove(part_file_path)
+
+    return save_data(data, output_file_path, data_format, debug_json)
 
 
 def process_pollution_data(
     pollution_data_dir,
     pollution_data_filename_base,
-    processing_output_dir
+    processing_output_dir,
+    keep_merged_data=False,
+    data_format='json',
+    debug_json=False,
+    pool=None
 ):
     if not os.path.exists(processing_output_dir):
         os.makedirs(processing_output_dir)
     
-    pollution_files = sorted(
-        [os.path.join(pollution_data_dir, file)
-            for file in os.listdir(pollution_data_dir) 
-            if get_basename(file) == pollution_data_filename_base and 
-                os.path.isfile(os.path.join(pollution_data_dir, file))
-        ]
-    )
+    pollution_files = get_data_files(pollution_data_dir, pollution_data_filename_base)
 
-    merge_filename = get_filename(pollution_data_filename_base, '_total')
-    merge_file_path = os.path.join(processing_output_dir, merge_filename)
-    merge_pollution_data(
-        pollution_files,
-        merge_file_path
-    )
+    merge_file_path = None
+    if keep_merged_data:
+        merge_filename = get_filename(pollution_data_filename_base, '_total')
+        merge_file_path = os.path.join(processing_output_dir, merge_filename)
 
     result_file_path = os.path.join(processing_output_dir, 'processed_pollution_data.json')
-    reformat_pollution_data(merge_file_path, result_file_path)
-
-    return result_file_path
+    return aggregate_pollution_data(pollution_files, result_file_path, merge_file_path, data_format, debug_json, pool)
 
 
-def get_government_data(government_data_file, data={}):
+def get_government_data(government_data_file, data=None):
+    data = {} if data is None else data
     with open(government_data_file) as govfile:
         gov_data = json.load(govfile)
         for state in gov_data:
@@ -106,7 +253,8 @@ def get_government_data(government_data_file, data={}):
     return data
 
 
-def get_election_data(election_files, data={}):
+def get_election_data(election_files, data=None):
+    data = {} if data is None else data
     for file in election_files:
         with open(file, newline='', encoding="cp1252") as csvfile:
             reader = csv.DictReader(
@@ -144,74 +292,84 @@ def get_election_data(election_files, data={}):
     return data
 
 
+def parse_election_file(file):
+    return get_election_data([file])
+
+
+def add_election_data(data, partial_data):
+    """Adds the elections of partial election data to data, which may already contain the governments."""
+    for state, state_data in partial_data.items():
+        for year, dataset in state_data.items():
+            data.setdefault(state, {}).setdefault(year, {}).update(dataset)
+
+
 def process_election_data(
     election_data_dir,
     election_data_filename_base,
     government_data_file,
-    processing_output_dir
+    processing_output_dir,
+    data_format='json',
+    debug_json=False,
+    pool=None
 ):
-    election_files = [
-        os.path.join(election_data_dir, file) 
-            for file in os.listdir(election_data_dir) 
-            if get_basename(file) == election_data_filename_base and 
-                os.path.isfile(os.path.join(election_data_dir, file))
-    ]
+    election_files = get_data_files(election_data_dir, election_data_filename_base)
 
     print("Processing election data...")
     data = get_government_data(government_data_file)
-    data = get_election_data(election_files, data)
+    # every file is parsed on its own, in parallel if a process pool is given, and added in the order of the files
+    for partial_data in map_files(parse_election_file, election_files, pool):
+        add_election_data(data, partial_data)
 
     result_file_path = os.path.join(processing_output_dir, 'processed_election_data.json')
-    with open(result_file_path, mode="w") as output:
-        json.dump(data, output, indent=4, ensure_ascii=False)
-    
-    return result_file_path
+    return save_data(data, result_file_path, data_format, debug_json)
+
+
+def get_election_index(election_data):
+    """Returns the election years of every state as (sorted years : int[], keys : str[]) for lookups with `get_governing_election()`."""
+    index = {}
+    for state, state_data in election_data.items():
+        keys = sorted(state_data.keys(), key=int)
+        index[state] = ([int(key) for key in keys], keys)
+    return index
+
+
+def get_governing_election(election_data, election_index, state, year):
+    """Returns the latest election (or change of government) of a state in or before the given year. Empty if there is none."""
+    years, keys = election_index.get(state, ([], []))
+    position = bisect_right(years, int(year))
+    if position == 0:
+        return {}
+    return election_data[state][keys[position - 1]]
 
 
 def merge_processed_data(
     processed_pollution_data_filepath,
     processed_election_data_filepath,
-    processing_output_dir
+    processing_output_dir,
+    data_format='json',
+    debug_json=False
 ):
     print("Merging processed data...")
-    results_file_path = os.path.join(processing_output_dir, 'processed_data.json')
-    with open(processed_pollution_data_filepath) as pollution_file, \
-         open(processed_election_data_filepath) as election_file, \
-         open(results_file_path, "w") as output:
-        election_data = json.load(election_file)
-        pollution_data = json.load(pollution_file)
-        result_data = {}
-        for state, state_data in pollution_data.items():
-            if not state in result_data:
-                result_data[state] = {}
-
-            latest_election_year = ''
-            for year in state_data.keys():
-                if not year in result_data[state]:
-                    result_data[state][year] = {
-                        "pollution": {},
-                        "election": {},
-                    }
-            
-                result_data[state][year]["pollution"] = pollution_data[state][year]
-                
-                if not state in election_data:
-                    continue
+    election_data = load_data(processed_election_data_filepath)
+    election_index = get_election_index(election_data)
+    pollution_data = load_data(processed_pollution_data_filepath)
+    result_data = {}
+    for state, state_data in pollution_data.items():
+        if not state in result_data:
+            result_data[state] = {}
 
-                if year in election_data[state] or latest_election_year == '':
-                    if latest_election_year == '':
-                        for offset in range(1,5):
-                            year_candidate = str(int(year) - offset)
-                            if year_candidate in election_data[state]:
-                                latest_election_year = year_candidate
-                                break
-                    else:
-                        latest_election_year = year
-                    result_data[state][year]["election"] = election_data[state][latest_election_year]
+        for year in state_data.keys():
+            if not year in result_data[state]:
+                result_data[state][year] = {
+                    "pollution": {},
+                    "election": {},
+                }
         
-        json.dump(result_data, output, indent=4, ensure_ascii=False)
+            result_data[state][year]["pollution"] = pollution_data[state][year]
+            result_data[state][year]["election"] = get_governing_election(election_data, election_index, state, year)
     
-    return results_file_path
+    results_file_path = os.path.join(processing_output_dir, 'processed_data.json')
+    return save_data(result_data, results_file_path, data_format, debug_json)
 
 
 def handle_pre_processing(
@@ -220,32 +378,113 @@ def handle_pre_processing(
     government_data_file,
     processing_output_dir,
     pollution_data_filename_base="FS-10.csv",
-    election_data_filename_base="WE-Landtag.csv"
+    election_data_filename_base="WE-Landtag.csv",
+    force=False,
+    keep_merged_data=False,
+    station_data_dir=None,
+    station_data_filename_base="PM10.csv",
+    chunk_size=1000000,
+    data_format='json',
+    debug_json=False,
+    jobs=None
 ):
+    """Pre-processes the data and returns the path of the result file.
+
+    If `station_data_dir` is set, the pollution data is aggregated from the station measurements in it instead of
+    the yearly summaries in `pollution_data_dir`.
+    Intermediate and final results are written in `data_format` (see `save_data()`).
+    Pollution and election files are parsed at the same time by a pool of `jobs` processes (all CPUs if None, no pool if 1).
+    The result of a previous run is reused if all input files are unchanged, unless `force` is set.
+    """
 
-    processed_pollution_data_filepath = process_pollution_data(
-        pollution_data_dir,
-        pollution_data_filename_base,
-        processing_output_dir
+    if station_data_dir is None:
+        pollution_files = get_data_files(pollution_data_dir, pollution_data_filename_base)
+    else:
+        pollution_files = get_data_files(station_data_dir, station_data_filename_base)
+    fingerprint = get_fingerprint(
+        pollution_files +
+        get_data_files(election_data_dir, election_data_filename_base) +
+        [government_data_file],
+        {
+            'keep_merged_data': keep_merged_data,
+            'station_data': station_data_dir is not None,
+            'data_format': data_format,
+            'debug_json': debug_json,
+        }
     )
+    cached_result_filepath = None if force else get_cached_result(processing_output_dir, fingerprint)
+    if cached_result_filepath is not None:
+        print("Input data unchanged, using pre-processing results at:\n{}.".format(cached_result_filepath))
+        return cached_result_filepath
 
-    processed_election_data_filepath = process_election_data(
+    if station_data_dir is None:
+        process_pollution = lambda pool: process_pollution_data(
+            pollution_data_dir,
+            pollution_data_filename_base,
+            processing_output_dir,
+            keep_merged_data,
+            data_format,
+            debug_json,
+            pool
+        )
+    else:
+        from datavis.stations import process_station_data  # requires pandas, only imported if station data is used
+        process_pollution = lambda pool: process_station_data(
+            station_data_dir,
+            station_data_filename_base,
+            processing_output_dir,
+            chunk_size,
+            data_format,
+            debug_json,
+            pool
+        )
+
+    process_election = lambda pool: process_election_data(
         election_data_dir,
         election_data_filename_base,
         government_data_file,
-        processing_output_dir
+        processing_output_dir,
+        data_format,
+        debug_json,
+        pool
     )
 
+    # both stages share the process pool, so its workers are busy until the last file is parsed
+    with Pool(jobs) if not jobs == 1 else nullcontext() as pool, ThreadPoolExecutor(2) as executor:
+        pollution_future = executor.submit(process_pollution, pool)
+        election_future = executor.submit(process_election, pool)
+        processed_pollution_data_filepath = pollution_future.result()
+        processed_election_data_filepath = election_future.result()
+
     process_result_filepath = merge_processed_data(
         processed_pollution_data_filepath,
         processed_election_data_filepath,
-        processing_output_dir
+        processing_output_dir,
+        data_format,
+        debug_json
     )
 
+    set_cached_result(processing_output_dir, fingerprint, process_result_filepath)
+
     print("Preprocessing finished. Results are available at:\n{}.".format(process_result_filepath))
 
     return process_result_filepath
 
 
-if __name__ == "__main":
-    handle_pre_processing(parse_arguments())
+def main():
+    args = parse_arguments()
+
+    handle_pre_processing(
+        args.pollution_data_dir,
+        args.election_data_dir,
+        args.governments_data_file,
+        args.output,
+        force=args.force,
+        keep_merged_data=args.merged_data,
+        station_data_dir=args.station_data_dir,
+        data_format=args.data_format,
+        debug_json=args.debug_json,
+        jobs=args.jobs)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import os
+import pandas as pd
+from datavis.preprocess import get_data_files, map_files
+from datavis.storage import save_data
+
+STATION_COLUMNS = ['state', 'station_code', 'date', 'value']
+DAILY_LIMIT = 50  # µg/m³, limit of the daily PM10 average
+
+
+def read_station_chunks(file, chunk_size):
+    """Yields chunks of a station measurement file with the columns of `STATION_COLUMNS`. Missing values (`-`) are NaN."""
+    return pd.read_csv(
+        file,
+        sep=';',
+        header=0,
+        names=STATION_COLUMNS,
+        usecols=[0, 1, 2, 3],
+        dtype={'state': str, 'station_code': str, 'date': str},
+        decimal=',',
+        na_values=['-'],
+        encoding='utf-8-sig',
+        chunksize=chunk_size
+    )
+
+
+def get_daily_values(chunk):
+    """Returns sum and count of the measurements per state, station, year and day of a chunk.
+
+    Dates are expected as `DD.MM.YYYY` or `YYYY-MM-DD`, optionally followed by a time.
+    """
+    chunk = chunk[~(chunk['state'] == 'UBA') & chunk['value'].notnull()]
+    day = chunk['date'].str[:10].rename('day')
+    year = day.str[6:10].where(day.str[2] == '.', day.str[:4]).rename('year')
+    return chunk.groupby([chunk['state'], chunk['station_code'], year, day])['value'].agg(['sum', 'count'])
+
+
+def sum_daily_values(partial_daily_values):
+    """Returns the sum of results of `get_daily_values()`, grouped once instead of per added result. None if all are None."""
+    partial_daily_values = [daily_values for daily_values in partial_daily_values if daily_values is not None]
+    if not partial_daily_values:
+        return None
+    if len(partial_daily_values) == 1:
+        return partial_daily_values[0]
+    return pd.concat(partial_daily_values).groupby(level=[0, 1, 2, 3]).sum()
+
+
+def get_file_daily_values(job):
+    """Returns the daily values (see `get_daily_values()`) of a station file, read in chunks. Job is (file, chunk size)."""
+    file, chunk_size = job
+    return sum_daily_values([get_daily_values(chunk) for chunk in read_station_chunks(file, chunk_size)])
+
+
+def aggregate_daily_values(daily_values):
+    """Returns the processed pollution data (see `aggregate_pollution_data()`) of daily station values.
+
+    Like in the yearly summaries, a station's year average is the mean of its measurements and its days above limit
+    are the days with a mean above `DAILY_LIMIT`. Per state and year, the station values are summed up and counted.
+    Cleaned days above limit cannot be derived from measurements and are counted as missing (0).
+    """
+    daily_values = daily_values.assign(above_limit=daily_values['sum'] / daily_values['count'] > DAILY_LIMIT)
+    stations = daily_values.groupby(level=['state', 'station_code', 'year']).agg(
+        sum=('sum', 'sum'), count=('count', 'sum'), days_above_limit=('above_limit', 'sum'))
+    stations['year_average'] = stations['sum'] / stations['count']
+    states = stations.groupby(level=['state', 'year']).agg(
+        year_average=('year_average', 'sum'), days_above_limit=('days_above_limit', 'sum'), stations=('year_average', 'size'))
+
+    data = {}
+    for (state, year), row in states.iterrows():
+        counter = int(row['stations'])
+        data.setdefault(state, {})[year] = {
+            'year_average': float(row['year_average']),
+            'year_average_counter': counter,
+            'days_above_limit': float(row['days_above_limit']),
+            'days_above_limit_counter': counter,
+            'days_above_limit_cleaned': 0.0,
+            'days_above_limit_cleaned_counter': counter,
+        }
+    return data
+
+
+def process_station_data(
+    station_data_dir,
+    station_data_filename_base,
+    processing_output_dir,
+    chunk_size=1000000,
+    data_format='json',
+    debug_json=False,
+    pool=None
+):
+    """Aggregates hourly or daily station measurements chunk by chunk into the processed pollution data.
+
+    Memory is bounded by the number of station days, not by the number of measurements.
+    Files are read in parallel if a process pool is given, their daily values are added in the order of the files.
+    """
+    if not os.path.exists(processing_output_dir):
+        os.makedirs(processing_output_dir)
+
+    print("Processing air pollution station data...")
+    jobs = [(file, chunk_size) for file in get_data_files(station_data_dir, station_data_filename_base)]
+    daily_values = sum_daily_values(map_files(get_file_daily_values, jobs, pool))
+
+    data = {} if daily_values is None else aggregate_daily_values(daily_values)
+
+    result_file_path = os.path.join(processing_output_dir, 'processed_pollution_data.json')
+    return save_data(data, result_file_path, data_format, debug_json)
@@ -0,0 +1,145 @@
+### Processed data storage ##########
+#
+# Processed data maps state -> year -> record, e.g. `{'Bayern': {'2020': {'year_average': 22.0, ...}}}`.
+# Besides JSON, it can be stored as NumPy .npz file of state x year tables: one array of values and one
+# presence mask per (nested) record field. Records may contain ints, floats, strings, lists and dicts, a field
+# must hold the same kind in all records. Field paths and lists are stored JSON-encoded.
+
+import json
+import os
+import numpy as np
+
+FORMATS = {
+    'json': '.json',
+    'npz': '.npz',
+}
+
+def get_path(file_path, data_format):
+    """Returns the file path with the extension of the given format."""
+    return os.path.splitext(file_path)[0] + FORMATS[data_format]
+
+
+KINDS = [
+    ('dict', dict),
+    ('list', list),
+    ('str', str),
+    ('int', int),
+    ('float', float),
+]
+
+
+def get_kind(value):
+    """Returns the name of the value's kind, see `KINDS`. Raises TypeError for all other values, e.g. None or bool."""
+    for kind, kind_type in KINDS:
+        if type(value) is kind_type:
+            return kind
+    raise TypeError("Cannot store {!r} of type {} in .npz format.".format(value, type(value).__name__))
+
+
+def flatten_record(record, prefix=()):
+    """Yields (path, value) of all fields of a nested record, including the dicts themselves. Paths are tuples of keys."""
+    for key, value in record.items():
+        path = prefix + (key,)
+        yield path, value
+        if isinstance(value, dict):
+            yield from flatten_record(value, path)
+
+
+def write_npz(data, file_path):
+    states = list(data.keys())
+    years = sorted({year for state in data for year in data[state]}, key=int)
+    year_indices = {year: index for index, year in enumerate(years)}
+    shape = (len(states), len(years))
+
+    cells = np.zeros(shape, dtype=bool)
+    columns = {}  # path -> (kind, {(state_index, year_index): value})
+    for state_index, state in enumerate(states):
+        for year, record in data[state].items():
+            cell = (state_index, year_indices[year])
+            cells[cell] = True
+            for path, value in flatten_record(record):
+                kind, values = columns.setdefault(path, (get_kind(value), {}))
+                if not kind == get_kind(value):
+                    raise TypeError("Field {} of {} {} is {}, but {} in other records.".format(
+                        '/'.join(path), state, year, get_kind(value), kind))
+                values[cell] = value
+
+    arrays = {
+        'states': np.array(states, dtype=str),
+        'years': np.array(years, dtype=str),
+        'cells': cells,
+        'paths': np.array([json.dumps(path, ensure_ascii=False) for path in columns.keys()], dtype=str),
+        'kinds': np.array([kind for kind, _ in columns.values()], dtype=str),
+    }
+    for index, (kind, values) in enumerate(columns.values()):
+        mask = np.zeros(shape, dtype=bool)
+        if kind == 'int':
+            array = np.zeros(shape, dtype=np.int64)
+        elif kind == 'float':
+            array = np.full(shape, np.nan)
+        else:
+            array = np.full(shape, '', dtype=object)
+        for cell, value in values.items():
+            mask[cell] = True
+            if kind == 'list':
+                value = json.dumps(value, ensure_ascii=False)
+            if not kind == 'dict':
+                array[cell] = value
+        arrays['mask_{}'.format(index)] = mask
+        arrays['values_{}'.format(index)] = array.astype(str) if array.dtype == object else array
+
+    np.savez_compressed(file_path, **arrays)
+
+
+def read_npz(file_path):
+    data = {}
+    with np.load(file_path, allow_pickle=False) as arrays:
+        states = arrays['states'].tolist()
+        years = arrays['years'].tolist()
+        cells = arrays['cells']
+        columns = [
+            (json.loads(path), kind, arrays['mask_{}'.format(index)].tolist(), arrays['values_{}'.format(index)].tolist())
+            for index, (path, kind) in enumerate(zip(arrays['paths'].tolist(), arrays['kinds'].tolist()))
+        ]
+
+    for state_index, state in enumerate(states):
+        data[state] = {}
+        for year_index in np.flatnonzero(cells[state_index]).tolist():
+            record = {}
+            # parents precede their fields, see `flatten_record()`
+            for keys, kind, mask, values in columns:
+                if not mask[state_index][year_index]:
+                    continue
+                value = values[state_index][year_index]
+                if kind == 'dict':
+                    value = {}
+                elif kind == 'list':
+                    value = json.loads(value)
+                parent = record
+                for key in keys[:-1]:
+                    parent = parent[key]
+                parent[keys[-1]] = value
+            data[state][years[year_index]] = record
+    return data
+
+
+def save_data(data, file_path, data_format='json', debug_json=False):
+    """Writes processed data in the given format (see `FORMATS`) and returns the path of the written file.
+
+    If `debug_json` is set, a JSON file is written next to a binary file for inspection.
+    """
+    result_file_path = get_path(file_path, data_format)
+    if data_format == 'npz':
+        write_npz(data, result_file_path)
+    if data_format == 'json' or debug_json:
+        with open(get_path(file_path, 'json'), "w", newline="") as output:
+            json.dump(data, output, indent=4, ensure_ascii=False)
+    return result_file_path
+
+
+def load_data(file_path):
+    """Reads processed data written by `save_data()`. The format is detected by the file extension."""
+    if os.path.splitext(file_path)[1] == FORMATS['npz']:
+        return read_npz(file_path)
+    with open(file_path) as datafile:
+        return json.load(datafile)
@@ -0,0 +1,210 @@
+### Minimal SVG charts ##########
+#
+# Drop-in replacement for the parts of pygal used by datavis: line charts with interruptions and box charts.
+# Charts are written directly as SVG text, without building an object tree or templating.
+
+from abc import ABC, abstractmethod
+from xml.sax.saxutils import escape
+import math
+import textwrap
+
+WIDTH = 800
+HEIGHT = 600
+FONT = 'font-family="sans-serif" fill="#333"'
+LEGEND_COLUMNS = 3
+LEGEND_ROW_HEIGHT = 18
+
+
+class Style:
+    def __init__(self, colors=()):
+        self.colors = list(colors)
+
+
+class Chart(ABC):
+    """Base of the SVG charts. Offers the attributes and methods of pygal charts used by datavis."""
+
+    def __init__(self, dots_size=3):
+        self.dots_size = dots_size
+        self.title = None
+        self.x_title = None
+        self.y_title = None
+        self.x_labels = []
+        self.style = Style()
+        self.series = []
+
+    def add(self, title, values, allow_interruptions=False):
+        """Adds a series. Values are numbers, None or dicts with the keys `value` and optionally `label`."""
+        self.series.append({
+            'title': title,
+            'values': [value.get('value') if isinstance(value, dict) else value for value in values],
+            'allow_interruptions': allow_interruptions,
+        })
+
+    def get_color(self, index):
+        if not self.style.colors:
+            return '#333'
+        return self.style.colors[index % len(self.style.colors)]
+
+    def get_values(self):
+        return [value for series in self.series for value in series['values'] if value is not None]
+
+    def get_plot_area(self):
+        """Returns (left, top, right, bottom) of the plot area, leaving space for titles, labels and legend."""
+        legend_rows = math.ceil(len(self.series) / LEGEND_COLUMNS)
+        x_title_lines = len(self.get_x_title_lines())
+        top = 50 if self.title else 20
+        bottom = HEIGHT - 40 - x_title_lines * 16 - legend_rows * LEGEND_ROW_HEIGHT
+        return 80, top, WIDTH - 30, bottom
+
+    def get_x_title_lines(self):
+        if not self.x_title:
+            return []
+        return textwrap.wrap(' '.join(self.x_title.split()), 110)
+
+    def render_frame(self, y_scale, y_ticks):
+        left, top, right, bottom = self.get_plot_area()
+        parts = ['<rect width="{}" height="{}" fill="white"/>'.format(WIDTH, HEIGHT)]
+        if self.title:
+            parts.append('<text x="{}" y="30" text-anchor="middle" font-size="16" {}>{}</text>'.format(
+                WIDTH / 2, FONT, escape(self.title)))
+        if self.y_title:
+            parts.append('<text transform="translate(20,{}) rotate(-90)" text-anchor="middle" font-size="12" {}>{}</text>'.format(
+                (top + bottom) / 2, FONT, escape(self.y_title)))
+        for tick in y_ticks:
+            y = y_scale(tick)
+            parts.append('<line x1="{}" y1="{y:.1f}" x2="{}" y2="{y:.1f}" stroke="#ddd"/>'.format(left, right, y=y))
+            parts.append('<text x="{}" y="{:.1f}" text-anchor="end" font-size="10" {}>{}</text>'.format(
+                left - 5, y + 3, FONT, format_number(tick)))
+        parts.append('<line x1="{0}" y1="{1}" x2="{0}" y2="{2}" stroke="#999"/>'.format(left, top, bottom))
+        parts.append('<line x1="{0}" y1="{1}" x2="{2}" y2="{1}" stroke="#999"/>'.format(left, bottom, right))
+
+        y = bottom + 35
+        for line in self.get_x_title_lines():
+            parts.append('<text x="{}" y="{}" text-anchor="middle" font-size="11" {}>{}</text>'.format(
+                (left + right) / 2, y, FONT, escape(line)))
+            y += 16
+
+        column_width = (right - left) / LEGEND_COLUMNS
+        for index, series in enumerate(self.series):
+            x = left + (index % LEGEND_COLUMNS) * column_width
+            y_legend = y + (index // LEGEND_COLUMNS) * LEGEND_ROW_HEIGHT
+            parts.append('<rect x="{}" y="{}" width="10" height="10" fill="{}"/>'.format(x, y_legend - 9, self.get_color(index)))
+            parts.append('<text x="{}" y="{}" font-size="11" {}>{}</text>'.format(x + 15, y_legend, FONT, escape(series['title'])))
+        return parts
+
+    @abstractmethod
+    def render_plot(self, x_scale, y_scale):
+        """Returns the SVG elements of the series, given the functions mapping indices to x and values to y positions."""
+
+    @abstractmethod
+    def get_x_scale(self):
+        """Returns the function mapping a value's index to its x position."""
+
+    def render(self):
+        """Returns the chart as SVG document."""
+        left, top, right, bottom = self.get_plot_area()
+        y_ticks = get_ticks(self.get_values())
+        y_min, y_max = y_ticks[0], y_ticks[-1]
+        y_scale = lambda value: bottom - (value - y_min) / ((y_max - y_min) or 1) * (bottom - top)
+
+        parts = self.render_frame(y_scale, y_ticks) + self.render_plot(self.get_x_scale(), y_scale)
+        return '<?xml version="1.0" encoding="utf-8"?>\n<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}" viewBox="0 0 {0} {1}">\n{2}\n</svg>\n'.format(
+            WIDTH, HEIGHT, '\n'.join(parts))
+
+    def render_to_file(self, filename):
+        with open(filename, 'w', encoding='utf-8') as output:
+            output.write(self.render())
+
+
+class Line(Chart):
+    """Line chart. `None` values interrupt a series if it was added with `allow_interruptions`, else they are skipped."""
+
+    def get_x_scale(self):
+        left, _, right, _ = self.get_plot_area()
+        count = max([len(self.x_labels)] + [len(series['values']) for series in self.series])
+        step = (right - left) / max(count, 1)
+        return lambda index: left + step * (index + 0.5)
+
+    def render_plot(self, x_scale, y_scale):
+        _, _, _, bottom = self.get_plot_area()
+        parts = []
+        for index, label in enumerate(self.x_labels):
+            parts.append('<text x="{:.1f}" y="{}" text-anchor="middle" font-size="10" {}>{}</text>'.format(
+                x_scale(index), bottom + 15, FONT, escape(str(label))))
+
+        for series_index, series in enumerate(self.series):
+            color = self.get_color(series_index)
+            segments = [[]]
+            for index, value in enumerate(series['values']):
+                if value is None:
+                    if series['allow_interruptions'] and segments[-1]:
+                        segments.append([])
+                    continue
+                segments[-1].append((x_scale(index), y_scale(value), value))
+
+            for segment in segments:
+                if len(segment) > 1:
+                    parts.append('<polyline fill="none" stroke="{}" stroke-width="2" points="{}"/>'.format(
+                        color, ' '.join('{:.1f},{:.1f}'.format(x, y) for x, y, _ in segment)))
+                for x, y, value in segment:
+                    parts.append('<circle cx="{:.1f}" cy="{:.1f}" r="{}" fill="{}"><title>{}</title></circle>'.format(
+                        x, y, self.dots_size, color, format_number(value)))
+        return parts
+
+
+class Box(Chart):
+    """Box chart with whiskers at the extremes, one box per series."""
+
+    def get_x_scale(self):
+        left, _, right, _ = self.get_plot_area()
+        step = (right - left) / max(len(self.series), 1)
+        return lambda index: left + step * (index + 0.5)
+
+    def render_plot(self, x_scale, y_scale):
+        left, _, right, _ = self.get_plot_area()
+        half_width = (right - left) / max(len(self.series), 1) * 0.3
+        parts = []
+        for index, series in enumerate(self.series):
+            values = sorted(value for value in series['values'] if value is not None)
+            if not values:
+                continue
+            color = self.get_color(index)
+            x = x_scale(index)
+            minimum, q1, median, q3, maximum = [y_scale(get_quantile(values, p)) for p in (0, 0.25, 0.5, 0.75, 1)]
+            parts.append('<g stroke="{}" stroke-width="1.5"><title>{}: {} values</title>'.format(color, escape(series['title']), len(values)))
+            parts.append('<line x1="{0:.1f}" y1="{1:.1f}" x2="{0:.1f}" y2="{2:.1f}"/>'.format(x, maximum, q3))
+            parts.append('<line x1="{0:.1f}" y1="{1:.1f}" x2="{0:.1f}" y2="{2:.1f}"/>'.format(x, q1, minimum))
+            for y in (minimum, maximum):
+                parts.append('<line x1="{:.1f}" y1="{y:.1f}" x2="{:.1f}" y2="{y:.1f}"/>'.format(x - half_width / 2, x + half_width / 2, y=y))
+            parts.append('<rect x="{:.1f}" y="{:.1f}" width="{:.1f}" height="{:.1f}" fill="{}" fill-opacity="0.5"/>'.format(
+                x - half_width, q3, 2 * half_width, max(q1 - q3, 0.5), color))
+            parts.append('<line x1="{:.1f}" y1="{y:.1f}" x2="{:.1f}" y2="{y:.1f}" stroke-width="3"/>'.format(x - half_width, x + half_width, y=median))
+            parts.append('</g>')
+        return parts
+
+
+def get_quantile(sorted_values, fraction):
+    """Returns the quantile (0..1) of sorted values, interpolating linearly between neighbours."""
+    position = (len(sorted_values) - 1) * fraction
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def get_ticks(values, count=8):
+    """Returns evenly spaced, rounded axis ticks covering all values."""
+    if not values:
+        return [0, 1]
+    minimum, maximum = min(values), max(values)
+    if minimum == maximum:
+        minimum, maximum = minimum - 1, maximum + 1
+    raw_step = (maximum - minimum) / count
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    step = next(factor * magnitude for factor in (1, 2, 2.5, 5, 10) if factor * magnitude >= raw_step)
+    first = math.floor(minimum / step)
+    last = math.ceil(maximum / step)
+    return [tick * step for tick in range(first, last + 1)]
+
+
+def format_number(value):
+    return '{:.10g}'.format(round(value, 6))
@@ -1,3 +1,5 @@
+import argparse
+
 ### File utils ##########
 
 def get_basename(filename):
@@ -56,6 +58,16 @@ def is_no_state_assigned(line):
     return line.startswith("UBA;")
 
 
+### Argument parsing ##########
+
+def positive_int(value):
+    """argparse type of counts that must be at least 1, e.g. the number of processes."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got {}".format(value))
+    return number
+
+
 ### Type verification ##########
 
 def is_date(str):
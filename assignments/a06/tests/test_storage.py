@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+from datavis.storage import read_npz, write_npz
+
+
+class NpzStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, 'data.npz')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        data = {
+            'Bayern': {
+                '2002': {
+                    'pollution': {'year_average': 22.5, 'year_average_counter': 3, 'station.name': 'München'},
+                    'election': {'government': [''], 'cdu_csu': 0.5},
+                },
+                '2003': {
+                    'pollution': {'year_average': 20.0, 'year_average_counter': 4, 'station.name': ''},
+                    'election': {},
+                },
+            },
+            'Bremen': {
+                '2003': {
+                    'pollution': {'year_average': 18.25, 'year_average_counter': 1, 'station.name': 'Bremen-Ost'},
+                    'election': {'government': [], 'spd': 0.25},
+                },
+            },
+        }
+        write_npz(data, self.file_path)
+        result = read_npz(self.file_path)
+
+        self.assertEqual(result, data)
+        self.assertIs(type(result['Bayern']['2002']['pollution']['year_average_counter']), int)
+        self.assertIs(type(result['Bayern']['2003']['pollution']['year_average']), float)
+
+    def test_mixed_kinds(self):
+        for values in [(1, 'one'), (1, 2.5), ('one', ['one'])]:
+            data = {'Bayern': {'2002': {'value': values[0]}, '2003': {'value': values[1]}}}
+            with self.assertRaises(TypeError, msg=values):
+                write_npz(data, self.file_path)
+
+    def test_unsupported_kinds(self):
+        for value in [None, True]:
+            with self.assertRaises(TypeError, msg=value):
+                write_npz({'Bayern': {'2002': {'value': value}}}, self.file_path)
@@ -1,8 +1,10 @@
 import argparse
+import asyncio
+import collections
 import json
 import os
 import pandas
-import requests
+from dlcore.client import Downloader, DownloadError, add_download_arguments, get_downloader_options
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -27,50 +29,80 @@ def parse_arguments():
     parser.add_argument('-n', '--nonce',
         help="WDT Nonce that will be sent with the request.",
         default="fd7361d203")
+    add_download_arguments(parser)
 
     return parser.parse_args()
 
 
+COOKIES = {
+    'wordpress_logged_in_368dc516f0d1b637edd28ca58fa0cafc': 'verhoevens|1644927019|j5VPv9RELi4brk6VVsjxijWV2dkhdetmGJT4JsQUP1R|ca0e2bb89643800f677d3df10975556221531b93da834992dbb99af6b8d0eb23',
+    'wordpress_sec_368dc516f0d1b637edd28ca58fa0cafc': '6e7b52a81ead8a407bedf003e19c56c32dd62fb30b15a6e704cc76340d9ad371'
+}
+
+
+async def fetch_page(downloader, args, start):
+    """Returns the table entries starting at index `start`. An empty list denotes the end of the table."""
+
+    payload = {
+        'draw': 8,
+        'start': start,
+        'length': args.entries_per_request,
+        'wdtNonce': args.nonce
+    }
+
+    try:
+        return (await downloader.fetch_json(args.data_url, method='POST', data=payload))['data']
+    except DownloadError as error:
+        raise ValueError("Download failed: {}, {}, {} ({})".format(start, args.entries_per_request, args.nonce, error.reason))
+
+
+async def download_pages(args):
+    """Downloads pages until an empty one is returned, keeping `concurrency` pages in flight and writing them in order."""
+
+    start = args.start
+    next_start = start
+    entries = 0
+    pending = collections.deque()
+    open_mode = 'w' if start == 0 or args.overwrite else 'a'
+
+    async with Downloader(cookies=COOKIES, **get_downloader_options(args)) as downloader:
+        try:
+            with open(args.output_path, open_mode) as output:
+                while True:
+                    while len(pending) < args.concurrency:
+                        pending.append((next_start, asyncio.ensure_future(fetch_page(downloader, args, next_start))))
+                        next_start += args.entries_per_request
+
+                    start, page = pending.popleft()
+                    print("Querying {}... ({})".format(start, downloader.metrics.get_rate()), end="\r")
+                    fetched_data = await page
+
+                    if not fetched_data:
+                        break
+
+                    dataframe = pandas.read_json(json.dumps(fetched_data))
+                    output.write(dataframe.to_csv(sep=';', index=False, header=start==0))
+                    entries += len(fetched_data)
+        finally:
+            # pages requested beyond the end of the table or after a failure must not outlive the session
+            for _, page in pending:
+                page.cancel()
+            await asyncio.gather(*[page for _, page in pending], return_exceptions=True)
+
+        print("\n{}".format(downloader.metrics.get_summary()))
+
+    return entries
+
+
 def download():
     args = parse_arguments()
     
     if not os.path.exists(os.path.dirname(args.output_path)):
         os.makedirs(os.path.dirname(args.output_path))
-    
-    start = args.start
-    data_fetched = True
-    open_mode = 'w' if start == 0 or args.overwrite else 'a'
 
-    while data_fetched:
-        print("Querying {}...".format(start), end="\r")
-        
-        payload = {
-            'draw': 8,
-            'start': start,
-            'length': args.entries_per_request,
-            'wdtNonce': args.nonce
-        }
-        cookies = {
-            'wordpress_logged_in_368dc516f0d1b637edd28ca58fa0cafc': 'verhoevens|1644927019|j5VPv9RELi4brk6VVsjxijWV2dkhdetmGJT4JsQUP1R|ca0e2bb89643800f677d3df10975556221531b93da834992dbb99af6b8d0eb23',
-            'wordpress_sec_368dc516f0d1b637edd28ca58fa0cafc': '6e7b52a81ead8a407bedf003e19c56c32dd62fb30b15a6e704cc76340d9ad371'
-        }
-
-        request = requests.post(args.data_url, cookies=cookies, data=payload)
-        
-        if not request.status_code == 200:
-            raise ValueError("({}) Download failed: {}, {}, {}".format(request.status_code, start, args.entries_per_request, args.nonce))
-        
-        fetched_data = request.json()['data']
-        data_fetched = bool(fetched_data)
-
-        with open(args.output_path, open_mode) as output:
-            dataframe = pandas.read_json(json.dumps(fetched_data))
-            output.write(dataframe.to_csv(sep=';', index=False, header=start==0))
-    
-        open_mode = 'a'
-        start += args.entries_per_request
+    entries = asyncio.run(download_pages(args))
     
-    print("Download finished. {} entries downloaded.".format(start-args.entries_per_request-1))
+    print("Download finished. {} entries downloaded.".format(entries))
 
 if __name__ == '__main__':
     download()
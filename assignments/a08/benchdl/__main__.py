@@ -0,0 +1,190 @@
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from benchdl.server import DEFAULT_CONFIG, FakeServer, get_bahn_rows
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        "Benchmark the downloaders against a local fake server.")
+    parser.add_argument('-l', '--latency',
+        help="Seconds added to every response.",
+        type=float, default=DEFAULT_CONFIG['latency'])
+    parser.add_argument('-j', '--jitter',
+        help="Maximum random seconds added on top of the latency.",
+        type=float, default=DEFAULT_CONFIG['jitter'])
+    parser.add_argument('-e', '--error-rate',
+        help="Fraction of requests (0..1) answered with HTTP 500.",
+        type=float, default=DEFAULT_CONFIG['error_rate'])
+    parser.add_argument('-t', '--throttle',
+        help="Maximum number of requests per second, further requests are answered with HTTP 429. 0 disables throttling.",
+        dest='max_requests_per_second', type=int, default=DEFAULT_CONFIG['max_requests_per_second'])
+    parser.add_argument('-r', '--bahn-rows',
+        help="Number of rows served by the fake WDT endpoint.",
+        type=int, default=DEFAULT_CONFIG['bahn_rows'])
+    parser.add_argument('-s', '--stations',
+        help="Number of distinct train stations in the fake bahn data.",
+        type=int, default=DEFAULT_CONFIG['stations'])
+    parser.add_argument('-f', '--climate-files',
+        help="Number of zip files in the fake DWD listing.",
+        type=int, default=DEFAULT_CONFIG['climate_files'])
+    parser.add_argument('-b', '--climate-file-size',
+        help="Size of the data file in every zip file in bytes.",
+        type=int, default=DEFAULT_CONFIG['climate_file_size'])
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # serve
+    serve_parser = subparsers.add_parser('serve', help="Run the fake server until interrupted.")
+    serve_parser.add_argument('-p', '--port',
+        help="Port to listen on.",
+        type=int, default=8000)
+
+    # run
+    run_parser = subparsers.add_parser('run', help="Run downloaders against the fake server and report throughput.")
+    run_parser.add_argument('modes',
+        help="Downloader modes to benchmark (bahndl, climatedl, geodl). All modes if unset.",
+        nargs='*', default=[])
+    run_parser.add_argument('-o', '--output-dir',
+        help="Directory for downloaded data. A temporary directory is used if unset.",
+        default=None)
+    run_parser.add_argument('-c', '--concurrency',
+        help="Maximum number of parallel requests passed to every downloader. Downloader default if unset.",
+        type=int, default=None)
+
+    return parser.parse_args()
+
+
+def get_bahndl_command(server, output_dir, config):
+    return ['bahndl', server.get_url('WDT'), os.path.join(output_dir, 'bahn_data.csv'), '-o']
+
+
+def get_climatedl_command(server, output_dir, config):
+    return ['climatedl', server.get_url('DWD'), os.path.join(output_dir, 'dwd'), '-e=zip']
+
+
+def get_geodl_command(server, output_dir, config):
+    bahn_data_path = os.path.join(output_dir, 'geodl_input', 'bahn_data.csv')
+    if not os.path.exists(bahn_data_path):
+        os.makedirs(os.path.dirname(bahn_data_path), exist_ok=True)
+        # one journey per station pair is enough to make geodl query every station once
+        rows = get_bahn_rows(0, config['stations'], config)
+        with open(bahn_data_path, 'w', newline='', encoding='utf-8') as bahn_file:
+            writer = csv.DictWriter(bahn_file, fieldnames=rows[0].keys(), delimiter=';')
+            writer.writeheader()
+            writer.writerows(rows)
+    return ['geodl', bahn_data_path, '-o={}'.format(os.path.join(output_dir, 'geo')), '-a={}'.format(server.get_url('GEOCODE'))]
+
+
+# mode -> (endpoint measured, function returning the downloader module and its arguments)
+MODES = {
+    'bahndl': ('wdt', get_bahndl_command),
+    'climatedl': ('dwd', get_climatedl_command),
+    'geodl': ('geocode', get_geodl_command),
+}
+
+
+def get_percentile(sorted_values, percentile):
+    """Returns the nearest-rank percentile (0..100) of already sorted values."""
+
+    if not sorted_values:
+        return 0
+    index = max(0, min(len(sorted_values) - 1, round(percentile / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_mode(server, mode, output_dir, concurrency=None):
+    """Runs the downloader of a mode as a subprocess and returns its metrics as dict."""
+
+    endpoint, get_command = MODES[mode]
+    command = get_command(server, output_dir, server.config)
+    if concurrency is not None:
+        command.append('--concurrency={}'.format(concurrency))
+
+    server.metrics.reset()
+    started_at = time.perf_counter()
+    process = subprocess.run([sys.executable, '-m'] + command, cwd=PACKAGE_ROOT,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    duration = time.perf_counter() - started_at
+
+    records = server.metrics.get(endpoint)
+    latencies = sorted(latency for _, latency, _ in records)
+    transferred = sum(size for status, _, size in records if status == 200)
+
+    if not process.returncode == 0:
+        print("{} exited with code {}:\n{}".format(mode, process.returncode, '\n'.join(process.stderr.strip().splitlines()[-1:])))
+
+    return {
+        'mode': mode,
+        'exit_code': process.returncode,
+        'requests': len(records),
+        'errors': sum(1 for status, _, _ in records if not status == 200),
+        'duration': duration,
+        'requests_per_second': len(records) / duration,
+        'bytes_per_second': transferred / duration,
+        'p50': get_percentile(latencies, 50),
+        'p95': get_percentile(latencies, 95),
+        'p99': get_percentile(latencies, 99),
+    }
+
+
+def print_results(results):
+    header = "{:<12} {:>5} {:>9} {:>7} {:>9} {:>10} {:>12} {:>9} {:>9} {:>9}".format(
+        'mode', 'exit', 'requests', 'errors', 'time [s]', 'req/s', 'MB/s', 'p50 [ms]', 'p95 [ms]', 'p99 [ms]')
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        print("{:<12} {:>5} {:>9} {:>7} {:>9.2f} {:>10.1f} {:>12.2f} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+            result['mode'], result['exit_code'], result['requests'], result['errors'], result['duration'],
+            result['requests_per_second'], result['bytes_per_second'] / 1e6,
+            result['p50'] * 1000, result['p95'] * 1000, result['p99'] * 1000))
+
+
+def serve(server, args):
+    print("Fake server listening on {}".format(server.url))
+    for path_id in ['WDT', 'DWD', 'GEOCODE']:
+        print("  {:<8} {}".format(path_id, server.get_url(path_id)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def run(server, args):
+    modes = args.modes or list(MODES.keys())
+    unknown_modes = set(modes) - set(MODES.keys())
+    if unknown_modes:
+        raise ValueError("Unknown modes: {}".format(', '.join(unknown_modes)))
+
+    server.start()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_dir = args.output_dir or temp_dir
+        results = []
+        for mode in modes:
+            print("Benchmarking {}...".format(mode))
+            results.append(run_mode(server, mode, output_dir, args.concurrency))
+
+    server.shutdown()
+    print_results(results)
+
+
+def main():
+    args = parse_arguments()
+
+    config = {key: getattr(args, key) for key in DEFAULT_CONFIG}
+    server = FakeServer(args.port if args.command == 'serve' else 0, **config)
+
+    with server:
+        if args.command == 'serve':
+            serve(server, args)
+        else:
+            run(server, args)
+
+if __name__ == '__main__':
+    main()
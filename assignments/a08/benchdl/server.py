@@ -0,0 +1,234 @@
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_CONFIG = {
+    'latency': 0.0,  # seconds added to every response
+    'jitter': 0.0,  # maximum random seconds added on top of latency
+    'error_rate': 0.0,  # fraction of requests answered with HTTP 500
+    'max_requests_per_second': 0,  # requests above this rate are answered with HTTP 429, 0 disables throttling
+    'bahn_rows': 100000,  # number of rows served by the WDT endpoint
+    'stations': 200,  # number of distinct train stations in bahn data
+    'climate_files': 20,  # number of zip files in the DWD listing
+    'climate_file_size': 1000000,  # size of the data file inside every zip in bytes
+}
+
+PATHS = {
+    'WDT': '/wp-admin/admin-ajax.php',
+    'DWD': '/climate_environment/CDC/observations_germany/climate/hourly/air_temperature/historical/',
+    'GEOCODE': '/geocode/v1/json',
+}
+
+
+def get_station_name(index):
+    return "Teststadt {} Hbf".format(index)
+
+
+def get_climate_filename(index):
+    return "stundenwerte_TU_{:05d}_19500101_20201231_hist.zip".format(index)
+
+
+def get_coordinates(location):
+    """Returns deterministic fake coordinates within Germany for a location name."""
+
+    digest = hashlib.md5(location.encode('utf-8')).digest()
+    return {
+        'lat': 47.3 + digest[0] / 255 * 7.7,
+        'lng': 5.9 + digest[1] / 255 * 9.1,
+    }
+
+
+def get_bahn_rows(start, length, config):
+    """Returns rows `start` to `start+length` of the fake bahn data in the format of the WDT endpoint."""
+
+    rows = []
+    for index in range(start, min(start + length, config['bahn_rows'])):
+        rows.append({
+            'date': '{:02d}/01/2021'.format(index % 28 + 1),
+            'start_station': get_station_name(index % config['stations']),
+            'end_station': get_station_name((index * 7 + 1) % config['stations']),
+            'departure_at': '{:02d}:{:02d}'.format(index % 24, index % 60),
+            'arrival_at': '{:02d}:{:02d}'.format((index + 1) % 24, index % 60),
+            'train': 'RE {}'.format(index % 100),
+            'delay': index % 17,
+            'delay_category': index % 4,
+            'canceled': 1 if index % 50 == 0 else '',
+        })
+    return rows
+
+
+class Metrics:
+    """Thread-safe collection of per-endpoint request metrics."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.records = {}
+
+    def record(self, endpoint, status, latency, size):
+        with self.lock:
+            self.records.setdefault(endpoint, []).append((status, latency, size))
+
+    def get(self, endpoint):
+        """Returns a list of (status, latency, size) tuples of all requests to the endpoint."""
+
+        with self.lock:
+            return list(self.records.get(endpoint, []))
+
+
+class Throttle:
+    """Sliding one second window limiting the number of accepted requests."""
+
+    def __init__(self, max_requests_per_second):
+        self.max_requests_per_second = max_requests_per_second
+        self.lock = threading.Lock()
+        self.timestamps = []
+
+    def accept(self):
+        if not self.max_requests_per_second:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            self.timestamps = [timestamp for timestamp in self.timestamps if now - timestamp < 1]
+            if len(self.timestamps) >= self.max_requests_per_second:
+                return False
+            self.timestamps.append(now)
+            return True
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """Answers requests like the WDT, DWD and OpenCage endpoints do."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def handle_request(self):
+        started_at = time.perf_counter()
+        url = urlparse(self.path)
+        endpoint, handler = self.get_endpoint(url.path)
+
+        body = b''
+        if self.command == 'POST':
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        config = self.server.config
+        time.sleep(config['latency'] + random.uniform(0, config['jitter']))
+
+        if handler is None:
+            status, content_type, content = 404, 'text/plain', b'Not Found'
+        elif not self.server.throttle.accept():
+            status, content_type, content = 429, 'text/plain', b'Too Many Requests'
+        elif random.random() < config['error_rate']:
+            status, content_type, content = 500, 'text/plain', b'Internal Server Error'
+        else:
+            status, content_type, content = handler(url, body)
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+        self.server.metrics.record(endpoint, status, time.perf_counter() - started_at, len(content))
+
+    def get_endpoint(self, path):
+        if path == PATHS['WDT']:
+            return 'wdt', self.handle_wdt
+        if path == PATHS['GEOCODE']:
+            return 'geocode', self.handle_geocode
+        if path.startswith(PATHS['DWD']):
+            if path == PATHS['DWD']:
+                return 'dwd', self.handle_dwd_listing
+            return 'dwd', self.handle_dwd_file
+        return 'unknown', None
+
+    def handle_wdt(self, url, body):
+        params = parse_qs(body.decode('utf-8'))
+        start = int(params.get('start', ['0'])[0])
+        length = int(params.get('length', ['10000'])[0])
+        content = json.dumps({'data': get_bahn_rows(start, length, self.server.config)})
+        return 200, 'application/json', content.encode('utf-8')
+
+    def handle_geocode(self, url, body):
+        location = parse_qs(url.query).get('q', [''])[0]
+        content = json.dumps({'results': [{'geometry': get_coordinates(location)}]})
+        return 200, 'application/json', content.encode('utf-8')
+
+    def handle_dwd_listing(self, url, body):
+        links = ['<a href="../">../</a>'] + [
+            '<a href="{0}">{0}</a>'.format(get_climate_filename(index))
+            for index in range(self.server.config['climate_files'])]
+        content = '<html><body><pre>\n{}\n</pre></body></html>'.format('\n'.join(links))
+        return 200, 'text/html', content.encode('utf-8')
+
+    def handle_dwd_file(self, url, body):
+        filename = url.path[len(PATHS['DWD']):]
+        if filename not in self.server.climate_filenames:
+            return 404, 'text/plain', b'Not Found'
+        return 200, 'application/zip', self.server.get_zip_file()
+
+
+class FakeServer(ThreadingHTTPServer):
+    """Local stand-in for the Bahn, DWD and geocoding servers.
+
+    Parameters
+    ----------
+    port : int
+        Port to listen on. A free port is chosen if 0.
+    config : dict
+        Overwrites for `DEFAULT_CONFIG`.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port=0, **config):
+        super().__init__(('127.0.0.1', port), FakeHandler)
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self.metrics = Metrics()
+        self.throttle = Throttle(self.config['max_requests_per_second'])
+        self.climate_filenames = {get_climate_filename(index) for index in range(self.config['climate_files'])}
+        self.zip_file = None
+        self.zip_lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address)
+
+    def get_url(self, path_id):
+        return self.url + PATHS[path_id]
+
+    def get_zip_file(self):
+        """Returns the bytes of a zip file containing a data file of the configured size. Built once."""
+
+        with self.zip_lock:
+            if self.zip_file is None:
+                buffer = io.BytesIO()
+                with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zip_file:
+                    zip_file.writestr('produkt_tu_stunde_19500101_20201231_00000.txt',
+                        random.randbytes(self.config['climate_file_size']))
+                self.zip_file = buffer.getvalue()
+            return self.zip_file
+
+    def start(self):
+        """Serves requests in a background thread."""
+
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
@@ -1,8 +1,9 @@
 import argparse
+import asyncio
 import collections
 import os
-import requests
 from bs4 import BeautifulSoup
+from dlcore.client import Downloader, DownloadError, add_download_arguments, get_downloader_options
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -17,6 +18,7 @@ def parse_arguments():
         dest='extension',
         help="Extension of the files to download (e.g. 'zip'). If none is given, the type is guessed by the URL content.",
         default="")
+    add_download_arguments(parser)
 
     return parser.parse_args()
 
@@ -28,30 +30,36 @@ def get_extension(filenames):
     return max(occurences, key=occurences.get)[1:]
 
 
+async def download_files(args):
+    """Downloads all files linked in the directory listing at `data_url` concurrently."""
+
+    async with Downloader(**get_downloader_options(args)) as downloader:
+        listing = await downloader.fetch_text(args.data_url)
+
+        soup = BeautifulSoup(listing, 'html.parser')
+        links = [link.get('href') for link in soup.find_all('a') if link.get('href') and not link.get('href') == '../']
+        
+        extension = '.{}'.format(args.extension or get_extension(links))
+        links = [link for link in links if link.endswith(extension)]
+
+        results = await downloader.gather(
+            [downloader.download(os.path.join(args.data_url, link), os.path.join(args.output_dir, link)) for link in links],
+            desc="Downloading")
+
+        for result in results:
+            if isinstance(result, DownloadError):
+                print("({}) Failed to download {}".format(result.reason, result.url))
+
+        print(downloader.metrics.get_summary())
+
+
 def download():
     args = parse_arguments()
     
     if not os.path.exists(args.output_dir):
         os.makedirs(args.output_dir)
 
-    request = requests.get(args.data_url)
-
-    if not request.status_code == 200:
-        raise ValueError("Data download failed with HTTP Status Code {}".format(request.status_code))
-
-    soup = BeautifulSoup(request.text, 'html.parser');
-    links = [link.get('href') for link in soup.find_all('a') if not link == '../']
-    
-    extension = '.{}'.format(args.extension or get_extension(links))
-    
-    for link in links:
-        if link.endswith(extension):
-            url = os.path.join(args.data_url, link)
-            request = requests.get(url)
-            if not request.status_code == 200:
-                print("({}) Failed to download {}".format(request.status_code, url))
-            output_file_name = os.path.join(args.output_dir, link)
-            open(output_file_name, 'wb').write(request.content)
+    asyncio.run(download_files(args))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from urllib.parse import urlparse
+import aiohttp
+from tqdm import tqdm
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def bounded(cast, minimum, allow_minimum=True):
+    """Returns an argparse type converting values with `cast` that must be at least `minimum` (above if not `allow_minimum`)."""
+
+    def convert(value):
+        number = cast(value)
+        if number < minimum or (number == minimum and not allow_minimum):
+            raise argparse.ArgumentTypeError("must be {} {}, got {}".format(
+                "at least" if allow_minimum else "greater than", minimum, value))
+        return number
+
+    convert.__name__ = cast.__name__  # named in argparse's message for unparsable values
+    return convert
+
+
+def add_download_arguments(parser):
+    """Adds the arguments controlling a `Downloader` to an argument parser."""
+
+    parser.add_argument('--concurrency',
+        help="Maximum number of parallel requests per host.",
+        type=bounded(int, 1),
+        default=8)
+    parser.add_argument('--retries',
+        help="Number of retries of a failed request.",
+        type=bounded(int, 0),
+        default=5)
+    parser.add_argument('--backoff',
+        help="Seconds to wait before the first retry. Doubles with every further retry.",
+        type=bounded(float, 0),
+        default=0.5)
+    parser.add_argument('--timeout',
+        help="Seconds after which a single request is aborted.",
+        type=bounded(float, 0, allow_minimum=False),
+        default=300)
+
+
+def get_downloader_options(args):
+    """Returns the keyword arguments for a `Downloader` from parsed arguments (see `add_download_arguments()`)."""
+
+    return {
+        'concurrency': args.concurrency,
+        'retries': args.retries,
+        'backoff': args.backoff,
+        'timeout': args.timeout,
+    }
+
+
+class DownloadError(Exception):
+    """Raised if a request still fails after all retries."""
+
+    def __init__(self, url, reason):
+        super().__init__("Download failed for {}: {}".format(url, reason))
+        self.url = url
+        self.reason = reason
+
+
+class Metrics:
+    """Counts requests and transferred bytes of a `Downloader`."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.bytes = 0
+
+    def get_elapsed(self):
+        return time.perf_counter() - self.started_at
+
+    def get_rate(self):
+        """Returns a short description of the current transfer rate."""
+
+        elapsed = max(self.get_elapsed(), 1e-9)
+        return "{:.1f} req/s, {:.2f} MB/s".format(self.requests / elapsed, self.bytes / elapsed / 1e6)
+
+    def get_summary(self):
+        return "{} requests ({} retries, {} failed), {:.1f} MB in {:.1f}s ({})".format(
+            self.requests, self.retries, self.failures, self.bytes / 1e6, self.get_elapsed(), self.get_rate())
+
+
+class Downloader:
+    """Shared HTTP client with connection pooling, per-host concurrency limit and retries.
+
+    Use as async context manager:
+
+        async with Downloader(concurrency=4) as downloader:
+            data = await downloader.fetch_json(url)
+
+    Parameters
+    ----------
+    concurrency : int
+        Maximum number of parallel requests per host, at least 1.
+    retries : int
+        Number (>= 0) of retries of a request failing with a connection error, timeout, HTTP 429 or 5xx.
+    backoff : float
+        Seconds to wait before the first retry. Doubles with every further retry, a `Retry-After` header takes precedence.
+    timeout : float
+        Seconds after which a single request is aborted.
+    headers, cookies : dict
+        Sent with every request.
+    """
+
+    def __init__(self, concurrency=8, retries=5, backoff=0.5, timeout=300, headers=None, cookies=None):
+        if concurrency < 1 or retries < 0 or backoff < 0 or not timeout > 0:
+            raise ValueError("Invalid downloader options: concurrency {}, retries {}, backoff {}, timeout {}.".format(
+                concurrency, retries, backoff, timeout))
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.headers = headers
+        self.cookies = cookies
+        self.semaphores = {}
+        self.metrics = Metrics()
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers=self.headers,
+            cookies=self.cookies)
+        self.metrics = Metrics()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    def get_semaphore(self, url):
+        # waiting for a free slot must not count into the request timeout, so limit before the connection pool
+        host = urlparse(url).netloc
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.concurrency)
+        return self.semaphores[host]
+
+    def get_delay(self, attempt, retry_after=None):
+        """Returns seconds to wait before the given retry attempt (0-based)."""
+
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+        delay = self.backoff * 2 ** attempt
+        return delay + random.uniform(0, delay / 2)  # jitter avoids retrying in lockstep
+
+    async def request(self, method, url, handle_response, **kwargs):
+        """Sends a request, retrying on failure.
+
+        Parameters
+        ----------
+        method : str
+            HTTP method, e.g. 'GET'.
+        url : str
+            Requested URL.
+        handle_response : async (response : aiohttp.ClientResponse) => any
+            Called with a successful (HTTP 200) response. Its result is returned.
+        kwargs
+            Passed to `aiohttp.ClientSession.request()`, e.g. `params`, `data` or `headers`.
+
+        Raises
+        ------
+        DownloadError
+            If the request failed with a non-retryable status code or all retries failed.
+        """
+
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            # the slot is held per attempt only, a request waiting for its retry must not block other requests to the host
+            async with self.get_semaphore(url):
+                self.metrics.requests += 1
+                try:
+                    async with self.session.request(method, url, **kwargs) as response:
+                        if response.status == 200:
+                            return await handle_response(response)
+                        reason = "HTTP {}".format(response.status)
+                        if response.status not in RETRY_STATUS_CODES:
+                            break
+                        retry_after = response.headers.get('Retry-After')
+                except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                    reason = repr(error)
+
+            if attempt < self.retries:
+                self.metrics.retries += 1
+                await asyncio.sleep(self.get_delay(attempt, retry_after))
+
+        self.metrics.failures += 1
+        raise DownloadError(url, reason)
+
+    async def fetch(self, url, method='GET', **kwargs):
+        """Returns the response body as bytes."""
+
+        async def read(response):
+            content = await response.read()
+            self.metrics.bytes += len(content)
+            return content
+
+        return await self.request(method, url, read, **kwargs)
+
+    async def fetch_text(self, url, method='GET', encoding='utf-8', **kwargs):
+        """Returns the response body as str."""
+
+        return (await self.fetch(url, method, **kwargs)).decode(encoding)
+
+    async def fetch_json(self, url, method='GET', **kwargs):
+        """Returns the parsed JSON response body. Raises `DownloadError` if the body is no valid JSON, e.g. truncated."""
+
+        content = await self.fetch(url, method, **kwargs)
+        try:
+            return json.loads(content)
+        except ValueError as error:  # includes JSONDecodeError and UnicodeDecodeError
+            self.metrics.failures += 1
+            raise DownloadError(url, "invalid JSON ({})".format(error))
+
+    async def download(self, url, output_path, chunk_size=2**16, **kwargs):
+        """Streams the response body into a file. The file is only created once the download completed.
+        The partial file is removed if the download fails.
+        """
+
+        partial_output_path = output_path + '.part'
+
+        async def stream(response):
+            with open(partial_output_path, 'wb') as output:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    output.write(chunk)
+                    self.metrics.bytes += len(chunk)
+
+        try:
+            await self.request('GET', url, stream, **kwargs)
+            os.replace(partial_output_path, output_path)
+        finally:
+            if os.path.isfile(partial_output_path):
+                os.remove(partial_output_path)
+        return output_path
+
+    async def gather(self, coroutines, desc=None):
+        """Awaits all coroutines concurrently while showing the progress.
+
+        Returns
+        -------
+        Results in the order of `coroutines`. A `DownloadError` is returned instead of raised.
+        """
+
+        async def run(index, coroutine):
+            try:
+                return index, await coroutine
+            except DownloadError as error:
+                return index, error
+
+        tasks = [asyncio.ensure_future(run(index, coroutine)) for index, coroutine in enumerate(coroutines)]
+        results = [None] * len(tasks)
+
+        with tqdm(total=len(tasks), desc=desc) as progress:
+            for task in asyncio.as_completed(tasks):
+                index, result = await task
+                results[index] = result
+                progress.set_postfix_str(self.metrics.get_rate(), refresh=False)
+                progress.update()
+
+        return results
@@ -1,12 +1,21 @@
 import argparse
 from datetime import datetime
 import math
+import multiprocessing
 import os
 import random
 import shutil
 from numpy import NaN
 import pandas as pd
 from tqdm import tqdm
+from merge.__main__ import is_route_index
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got {}".format(value))
+    return number
+
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -17,41 +26,69 @@ def parse_arguments():
     parser.add_argument('-c', '--count-output-path',
         help="Path to the file that contains the output of data counting (must end on .csv).",
         default=None)
+    parser.add_argument('--chunk-size',
+        help="Number of rows read at once per file.",
+        default=1000000, type=int)
+    parser.add_argument('-j', '--jobs',
+        help="Number of files processed in parallel. Number of CPUs by default.",
+        default=os.cpu_count(), type=positive_int)
     
     return parser.parse_args()
 
 
-def count(bahn_data_dir, output_path):
+STATION_COLUMNS = ['start_station', 'end_station']
+
+
+def add_counts(counts):
+    """Returns the sum of the given counts (Series indexed by station pairs). Returns None for no counts."""
+
+    counts = [count for count in counts if count is not None and len(count.index) > 0]
+    if not counts:
+        return None
+    return pd.concat(counts).groupby(level=[0, 1]).sum()
+
+
+def count_file(job):
+    """Count the number of pairs of train_stations in a single bahn data file.
+
+    Parameters
+    ----------
+    job : (file_path : str, chunk_size : int)
+        File to count and number of rows read at once.
+
+    Returns
+    -------
+    Series indexed by (start_station, end_station) with the number of journeys.
+    """
+
+    file_path, chunk_size = job
+    count = None
+
+    for chunk in pd.read_csv(file_path, usecols=STATION_COLUMNS, chunksize=chunk_size):
+        count = add_counts([count, chunk.groupby(STATION_COLUMNS).size()])
+
+    return count
+
+
+def count(bahn_data_dir, output_path, chunk_size=1000000, jobs=None):
     """Count the number of pairs of train_stations in the bahn data."""
 
-    count = {}
-
-    filenames = os.listdir(bahn_data_dir)
-    for file_index, filename in enumerate(filenames):
-        print("Counting file {}/{}: {}".format(file_index+1, len(filenames), filename))
-        file_path = os.path.join(bahn_data_dir, filename)
-        bahn_data = pd.read_csv(file_path)
-        
-        for index in tqdm(range(len(bahn_data.index))):
-            start_station = bahn_data.at[index, "start_station"]
-            end_station = bahn_data.at[index, "end_station"]
-            station_counter = count.get(start_station, {})
-            station_counter[end_station] = station_counter.get(end_station, 0) + 1
-            count[start_station] = station_counter
-        
-        count_data = pd.DataFrame(columns=['start_station', 'end_station', 'number_of_journeys'])
-
-        for start_station, data in count.items():
-            for end_station, number_of_journeys in data.items():
-                new_data = pd.DataFrame({
-                    'start_station': [start_station],
-                    'end_station': [end_station],
-                    'number_of_journeys': [number_of_journeys]
-                })
-                count_data = pd.concat([count_data, new_data])
-        
-        count_data.sort_values(by=['number_of_journeys', 'start_station', 'end_station'], ascending=[False, True, True], inplace=True)
-        count_data.to_csv(output_path, index=False)
+    filenames = [filename for filename in os.listdir(bahn_data_dir) if not is_route_index(filename)]
+    file_jobs = [(os.path.join(bahn_data_dir, filename), chunk_size) for filename in filenames]
+    count = None
+
+    print("Counting {} files...".format(len(filenames)))
+    with multiprocessing.Pool(jobs) as pool:
+        for file_count in tqdm(pool.imap_unordered(count_file, file_jobs), total=len(file_jobs)):
+            count = add_counts([count, file_count])
+
+    if count is None:
+        print("No journeys found.")
+        return
+
+    count_data = count.rename('number_of_journeys').rename_axis(STATION_COLUMNS).reset_index()
+    count_data.sort_values(by=['number_of_journeys', 'start_station', 'end_station'], ascending=[False, True, True], inplace=True)
+    count_data.to_csv(output_path, index=False)
 
     print("Counting finished.")
 
@@ -61,7 +98,7 @@ def eval():
 
     if args.count_output_path is not None:
         output_path = args.count_output_path or os.path.join(args.bahn_data_dir, 'data_count.csv')
-        count(args.bahn_data_dir, output_path)
+        count(args.bahn_data_dir, output_path, args.chunk_size, args.jobs)
 
 
 if __name__ == '__main__':
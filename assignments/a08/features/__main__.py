@@ -0,0 +1,41 @@
+import argparse
+from features.store import COLUMN_SETS, LABELS, materialize
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        "Materialize features and labels of merged data as float32 arrays.")
+    parser.add_argument('data_paths',
+        metavar="data-path",
+        nargs='+',
+        help="Path to file with data (must end on .csv).")
+    parser.add_argument('-c', '--column-set',
+        help="Set of input columns to materialize.",
+        choices=list(COLUMN_SETS.keys()),
+        nargs='+',
+        default=list(COLUMN_SETS.keys()))
+    parser.add_argument('-l', '--label',
+        help="Labels to materialize.",
+        choices=list(LABELS.keys()),
+        nargs='+',
+        default=list(LABELS.keys()))
+    parser.add_argument('-s', '--store-dir',
+        help="Directory for the materialized features. Directory 'features' next to the data file if unset.",
+        default=None)
+    parser.add_argument('--chunk-size',
+        help="Number of rows read at once.",
+        default=1000000, type=int)
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    for data_path in args.data_paths:
+        for column_set in args.column_set:
+            for label in args.label:
+                feature_dir = materialize(data_path, COLUMN_SETS[column_set], label, args.store_dir, args.chunk_size)
+                print("{} ({}, {}): {}".format(data_path, column_set, label, feature_dir))
+
+if __name__ == '__main__':
+    main()
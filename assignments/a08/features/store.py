@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+INPUT_COLUMNS = [
+    # 'date','departure_at','arrival_at','train',# 'delay','canceled',
+    'start_tt_tu','end_tt_tu','start_rf_tu','end_rf_tu','start_r1','end_r1',
+    'start_p_std','end_p_std','start_f','end_f','start_fx_911','end_fx_911'
+]
+LOGISTIC_INPUT_COLUMNS = [
+    # 'date','departure_at','arrival_at','train','delay','canceled',
+    'start_tt_tu',
+    'end_tt_tu',
+    'start_rf_tu',
+    'end_rf_tu',
+    # 'start_r1',
+    # 'end_r1',
+    # 'start_p_std',
+    # 'end_p_std',
+    'start_f',
+    'end_f',
+    'start_fx_911',
+    'end_fx_911'
+]
+
+COLUMN_SETS = {
+    'linear': INPUT_COLUMNS,
+    'logistic': LOGISTIC_INPUT_COLUMNS,
+}
+
+# label -> (function returning the label values of a chunk, function returning the mask of rows to keep or None)
+LABELS = {
+    'delay': (lambda chunk: chunk['delay'], lambda chunk: chunk['canceled'] == 0),
+    'delayed': (lambda chunk: (chunk['delay'] >= 15) | (chunk['canceled'] > 0), None),
+    'canceled': (lambda chunk: chunk['canceled'], None),
+}
+
+FILENAMES = {
+    'INPUT': 'input.npy',
+    'OUTPUT': 'output.npy',
+    'META': 'meta.json',
+}
+
+STORE_VERSION = 1
+
+
+def get_fingerprint(data_path, input_columns, label):
+    """Returns a hash identifying the source file (path, size, modification time), the column set and the label."""
+
+    stat = os.stat(data_path)
+    key = json.dumps([STORE_VERSION, os.path.abspath(data_path), stat.st_size, stat.st_mtime_ns, list(input_columns), label])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def get_feature_dir(data_path, input_columns, label, store_dir=None):
+    """Returns the directory of the materialized features. Located in `features` next to the data file if `store_dir` is unset."""
+
+    store_dir = store_dir or os.path.join(os.path.dirname(data_path), 'features')
+    basename = os.path.splitext(os.path.basename(data_path))[0]
+    return os.path.join(store_dir, '{}_{}_{}'.format(basename, label, get_fingerprint(data_path, input_columns, label)))
+
+
+def get_usecols(input_columns):
+    """Returns the columns read from a data file: the input columns, `delay` and `canceled`."""
+
+    return list(dict.fromkeys(list(input_columns) + ['delay', 'canceled']))
+
+
+def select_rows(chunk, label):
+    """Drops the rows with missing values and the rows filtered by the label.
+    Applied to data read with `get_usecols()`, so the same rows are used with and without feature store.
+    """
+
+    chunk = chunk.dropna()
+    filter_rows = LABELS[label][1]
+    if filter_rows is not None:
+        chunk = chunk[filter_rows(chunk)]
+    return chunk
+
+
+def read_labeled_frame(data_path, input_columns, label):
+    """Returns (input : DataFrame, output : Series) of the data file, parsed as CSV without feature store.
+    Contains the same rows as `load_feature_frame()`.
+    """
+
+    data = select_rows(pd.read_csv(data_path, usecols=get_usecols(input_columns)), label)
+    return data[input_columns], LABELS[label][0](data).rename(label)
+
+
+def _to_npy(raw_path, npy_path, shape, block_rows=1000000):
+    """Converts a file of raw float32 values into a .npy file of the given shape."""
+
+    target = np.lib.format.open_memmap(npy_path, mode='w+', dtype=np.float32, shape=shape)
+    if shape[0] > 0:
+        source = np.memmap(raw_path, dtype=np.float32, mode='r', shape=shape)
+        for start in range(0, shape[0], block_rows):
+            target[start:start+block_rows] = source[start:start+block_rows]
+        del source
+    target.flush()
+    del target
+    os.remove(raw_path)
+
+
+def materialize(data_path, input_columns, label, store_dir=None, chunk_size=1000000):
+    """Parses the data file once and stores its features and labels as float32 .npy files.
+
+    Rows with missing values in the input columns, `delay` or `canceled` are dropped, as well as rows filtered by the label.
+    Nothing is done if the features of the same file version, columns and label were already materialized.
+
+    Returns
+    -------
+    Directory containing the materialized features.
+    """
+
+    feature_dir = get_feature_dir(data_path, input_columns, label, store_dir)
+    meta_path = os.path.join(feature_dir, FILENAMES['META'])
+    if os.path.isfile(meta_path):
+        return feature_dir
+
+    print("Materializing features of {}...".format(data_path))
+    os.makedirs(feature_dir, exist_ok=True)
+
+    get_output = LABELS[label][0]
+    raw_input_path = os.path.join(feature_dir, 'input.raw')
+    raw_output_path = os.path.join(feature_dir, 'output.raw')
+    rows = 0
+
+    with open(raw_input_path, 'wb') as raw_input, open(raw_output_path, 'wb') as raw_output:
+        for chunk in pd.read_csv(data_path, usecols=get_usecols(input_columns), chunksize=chunk_size):
+            chunk = select_rows(chunk, label)
+            raw_input.write(chunk[input_columns].to_numpy(dtype=np.float32).tobytes())
+            raw_output.write(get_output(chunk).to_numpy(dtype=np.float32).tobytes())
+            rows += len(chunk.index)
+
+    _to_npy(raw_input_path, os.path.join(feature_dir, FILENAMES['INPUT']), (rows, len(input_columns)))
+    _to_npy(raw_output_path, os.path.join(feature_dir, FILENAMES['OUTPUT']), (rows,))
+
+    # written last, marks the features as complete
+    with open(meta_path, 'w') as meta_file:
+        json.dump({
+            'source': os.path.abspath(data_path),
+            'columns': list(input_columns),
+            'label': label,
+            'rows': rows,
+        }, meta_file, indent=4)
+
+    return feature_dir
+
+
+def load_features(data_path, input_columns, label, store_dir=None):
+    """Returns memory-mapped, read-only (input, output) arrays of the data file. Materializes them first if necessary."""
+
+    feature_dir = materialize(data_path, input_columns, label, store_dir)
+    return (
+        np.load(os.path.join(feature_dir, FILENAMES['INPUT']), mmap_mode='r'),
+        np.load(os.path.join(feature_dir, FILENAMES['OUTPUT']), mmap_mode='r'),
+    )
+
+
+def load_feature_frame(data_path, input_columns, label, store_dir=None):
+    """Returns (input : DataFrame, output : Series) as views on the memory-mapped features (see `load_features()`)."""
+
+    input_matrix, output = load_features(data_path, input_columns, label, store_dir)
+    return pd.DataFrame(input_matrix, columns=input_columns, copy=False), pd.Series(output, name=label, copy=False)
+
+
+def iter_feature_chunks(input_matrix, output, chunk_size):
+    """Yields (input, output) slices of the given arrays with at most `chunk_size` rows."""
+
+    for start in range(0, len(output), chunk_size):
+        yield input_matrix[start:start+chunk_size], output[start:start+chunk_size]
@@ -1,8 +1,10 @@
 import argparse
+import asyncio
 import os
 import pandas as pd
-import requests
 from tqdm import tqdm
+from dlcore.client import Downloader, DownloadError, add_download_arguments, get_downloader_options
+from geodl.gazetteer import load_gazetteer
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -22,10 +24,119 @@ def parse_arguments():
     parser.add_argument('-k', '--key',
         help="API key.",
         default="7c4214523aed4b3bb8861d85d76f719a")
+    parser.add_argument('-z', '--gazetteer-path',
+        help="Path to a local station gazetteer (CSV with columns location, latitude, longitude). Locations are resolved offline if set.",
+        default=None)
+    parser.add_argument('-f', '--api-fallback',
+        help="Query the Geo Data API for locations not found in the gazetteer.",
+        action='store_true')
+    add_download_arguments(parser)
     
     return parser.parse_args()
 
 
+async def query_coordinates(downloader, api_url, key, location):
+    """Returns [latitude, longitude] of the given location as returned by the Geo Data API. None if the API found no results."""
+
+    params = {
+        'q': location,
+        'key': key,
+        'no_annotations': 1,  # do not request additional annotations to make query faster
+        'language': 'de'
+    }
+
+    results = (await downloader.fetch_json(api_url, params=params)).get('results')
+    if not results:
+        return None
+    fetched_coordinates = results[0]['geometry']
+    return [fetched_coordinates['lat'], fetched_coordinates['lng']]
+
+
+async def query_locations(locations, args):
+    """Queries the Geo Data API for all locations concurrently.
+
+    Returns
+    -------
+    (Dict location : str -> [latitude, longitude], failed_locations : str[])
+    """
+
+    headers = {
+        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:96.0) Gecko/20100101 Firefox/96.0',
+    }
+
+    async with Downloader(headers=headers, **get_downloader_options(args)) as downloader:
+        results = await downloader.gather(
+            [query_coordinates(downloader, args.api_url, args.key, location) for location in locations],
+            desc="Querying")
+        print(downloader.metrics.get_summary())
+
+    raw_geo_data = {}
+    failed_locations = []
+    for location, result in zip(locations, results):
+        if isinstance(result, DownloadError):
+            print("({}) Download failed for {}".format(result.reason, location))
+            failed_locations.append(location)
+        elif result is None:
+            print("No results for {}".format(location))
+            failed_locations.append(location)
+        else:
+            raw_geo_data[location] = result
+
+    return raw_geo_data, failed_locations
+
+
+def resolve_locations(locations, gazetteer_path):
+    """Resolves locations with the local gazetteer.
+
+    Returns
+    -------
+    (Dict location : str -> [latitude, longitude], unresolved_locations : str[])
+    """
+
+    print("Loading gazetteer...")
+    gazetteer = load_gazetteer(gazetteer_path)
+
+    raw_geo_data = {}
+    unresolved_locations = []
+
+    print("Resolving geo data with {} gazetteer entries...".format(len(gazetteer)))
+    for location in tqdm(locations):
+        coordinates = gazetteer.lookup(location)
+        if coordinates is None:
+            unresolved_locations.append(location)
+        else:
+            raw_geo_data[location] = list(coordinates)
+
+    print("Resolved {}/{} locations offline.".format(len(raw_geo_data), len(locations)))
+
+    return raw_geo_data, unresolved_locations
+
+
+def merge_geo_data(bahn_data, geo_data):
+    """Adds start and end coordinates to the bahn data.
+
+    Parameters
+    ----------
+    bahn_data : DataFrame
+        Bahn data with columns `start_station` and `end_station`.
+    geo_data : DataFrame
+        Geo data indexed by `location` with columns `latitude` and `longitude`.
+
+    Returns
+    -------
+    DataFrame with additional columns `start_latitude`, `end_latitude`, `start_longitude` and `end_longitude`.
+    """
+
+    geo_data = geo_data[['latitude', 'longitude']]
+    geo_data = geo_data[~geo_data.index.duplicated(keep='last')]
+
+    for prefix in ['start', 'end']:
+        # one keyed join per station column instead of masking the whole frame per location
+        bahn_data = bahn_data.join(geo_data.add_prefix('{}_'.format(prefix)), on='{}_station'.format(prefix))
+
+    return bahn_data
+
+
 def download():
     args = parse_arguments()
 
@@ -39,55 +150,33 @@ def download():
     print("Reading bahn data...")
     bahn_data = pd.read_csv(args.data_path, sep=';')
     locations = pd.concat([bahn_data['start_station'], bahn_data['end_station']]).unique()
-    
-    bahn_data[[
-        'start_latitude',
-        'end_latitude',
-        'start_longitude',
-        'end_longitude'
-    ]] = None
 
     if args.geo_data_path is not None:
-        geo_data = pd.read_csv(args.geo_data_path)
+        geo_data = pd.read_csv(args.geo_data_path, index_col='location')
 
     else:
         raw_geo_data = {}
+        unresolved_locations = list(locations)
+
+        if args.gazetteer_path is not None:
+            raw_geo_data, unresolved_locations = resolve_locations(locations, args.gazetteer_path)
+
+        if unresolved_locations and (args.gazetteer_path is None or args.api_fallback):
+            print("Querying geo data...")
+            queried_geo_data, unresolved_locations = asyncio.run(query_locations(unresolved_locations, args))
+            raw_geo_data.update(queried_geo_data)
+            print("Download finished.")
 
-        print("Querying geo data...")
-        for location in tqdm(locations):        
-            params = {
-                'q': location,
-                'key': args.key,
-                'no_annotations': 1,  # do not request additional annotations to make query faster
-                'language': 'de'
-            }
-
-            headers = {
-                'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:96.0) Gecko/20100101 Firefox/96.0',
-            }
-
-            request = requests.get(args.api_url, params=params, headers=headers)
-            
-            if not request.status_code == 200:
-                raise ValueError("({}) Download failed for {}".format(request.status_code, location))
-            
-            fetched_coordinates = request.json()['results'][0]['geometry']
-            raw_geo_data[location] = [fetched_coordinates['lat'], fetched_coordinates['lng']]
-        
-        print("Download finished.")
+        if unresolved_locations:
+            print("No coordinates found for {} locations: {}".format(
+                len(unresolved_locations), ', '.join(unresolved_locations)))
 
         geo_data = pd.DataFrame.from_dict(raw_geo_data, orient='index', columns=['latitude', 'longitude'])
         geo_data.index.name = 'location'
         geo_data.to_csv(geo_output_path)
 
     print("Merging geo data...")
-    for _, row in tqdm(geo_data.iterrows()):
-        location = row['location']
-        for prefix in ['start', 'end']:
-            location_applys = bahn_data['{}_station'.format(prefix)] == location
-            for coordinate in ['latitude', 'longitude']:
-                column = '{}_{}'.format(prefix, coordinate)
-                bahn_data.loc[location_applys, column] = row[coordinate]
+    bahn_data = merge_geo_data(bahn_data, geo_data)
     
     print("Merging finished. Writing data...")
     bahn_data.to_csv(output_path, index=False)
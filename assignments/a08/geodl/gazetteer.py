@@ -0,0 +1,152 @@
+import csv
+import difflib
+import re
+
+ABBREVIATIONS = {
+    'hbf': 'hauptbahnhof',
+    'bf': 'bahnhof',
+    'bhf': 'bahnhof',
+    'pbf': 'personenbahnhof',
+    'str': 'strasse',
+    'st': 'sankt',
+}
+
+# words shared by many station names, ignored when comparing names by similarity
+STATION_WORDS = {'hauptbahnhof', 'bahnhof', 'personenbahnhof', 'haltepunkt'}
+
+UMLAUTS = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+
+
+def normalize_name(name):
+    """Returns a normalized station name used as key in the gazetteer index.
+
+    Given the name `Düsseldorf Hbf`, the normalized name were `duesseldorf hauptbahnhof`.
+    The name `Frankfurt(Main)Hbf` has the normalized name `frankfurt main hauptbahnhof`.
+    """
+    name = name.lower().translate(UMLAUTS)
+    # split glued abbreviations like 'Frankfurt(Main)Hbf'
+    name = re.sub(r'(?<=[a-z)])(hbf|bhf)\b', r' \1', name)
+    words = re.split(r'[^a-z0-9]+', name)
+    return ' '.join(ABBREVIATIONS.get(word, word) for word in words if word)
+
+
+def get_distinctive_name(normalized_name):
+    """Returns the normalized name without words of `STATION_WORDS`, or the name itself if nothing else remains.
+
+    Given the normalized name `essen hauptbahnhof`, the distinctive name were `essen`.
+    """
+    words = [word for word in normalized_name.split(' ') if word not in STATION_WORDS]
+    return ' '.join(words) or normalized_name
+
+
+def get_trigrams(name):
+    """Returns the set of character trigrams of a normalized name, padded at word boundaries."""
+
+    padded = '  {} '.format(name)
+    return {padded[index:index+3] for index in range(len(padded) - 2)}
+
+
+class Gazetteer:
+    """In-memory index of train station names to their coordinates.
+
+    Names are looked up by exact match of their normalized form first. If that fails, candidates sharing
+    the most trigrams with the query are ranked by their edit distance similarity. Ties are won by the entry added first,
+    so results do not depend on hash order. Trigrams and similarity are
+    computed on the distinctive names (see `get_distinctive_name()`), otherwise a shared `hauptbahnhof` would make
+    `Essen Hbf` similar to `Köln Hbf`.
+    """
+
+    def __init__(self, entries=(), min_similarity=0.8, max_candidates=20):
+        """
+        Parameters
+        ----------
+        entries : (name : str, latitude : float, longitude : float)[]
+            Stations to index.
+        min_similarity : float
+            Minimum similarity (0..1) of a fuzzy match to be accepted.
+        max_candidates : int
+            Number of trigram candidates that are compared by edit distance.
+        """
+
+        self.min_similarity = min_similarity
+        self.max_candidates = max_candidates
+        self.names = []
+        self.coordinates = []
+        self.exact_index = {}
+        self.trigram_index = {}
+
+        for name, latitude, longitude in entries:
+            self.add(name, latitude, longitude)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, latitude, longitude):
+        """Adds a station to the index. Later entries win on identical normalized names."""
+
+        normalized_name = normalize_name(name)
+        if normalized_name in self.exact_index:
+            self.coordinates[self.exact_index[normalized_name]] = (latitude, longitude)
+            return
+
+        entry_id = len(self.names)
+        distinctive_name = get_distinctive_name(normalized_name)
+        self.names.append(distinctive_name)
+        self.coordinates.append((latitude, longitude))
+        self.exact_index[normalized_name] = entry_id
+        for trigram in get_trigrams(distinctive_name):
+            self.trigram_index.setdefault(trigram, []).append(entry_id)
+
+    def lookup(self, name):
+        """Returns (latitude, longitude) of the station best matching the given name. Returns None at no matches."""
+
+        normalized_name = normalize_name(name)
+
+        entry_id = self.exact_index.get(normalized_name)
+        if entry_id is not None:
+            return self.coordinates[entry_id]
+
+        distinctive_name = get_distinctive_name(normalized_name)
+        trigrams = get_trigrams(distinctive_name)
+        overlaps = {}
+        for trigram in trigrams:
+            for candidate_id in self.trigram_index.get(trigram, []):
+                overlaps[candidate_id] = overlaps.get(candidate_id, 0) + 1
+
+        candidates = sorted(overlaps, key=lambda candidate_id: (-overlaps[candidate_id], candidate_id))[:self.max_candidates]
+
+        best_id = None
+        best_similarity = None
+        matcher = difflib.SequenceMatcher(b=distinctive_name, autojunk=False)
+        for candidate_id in candidates:
+            matcher.set_seq1(self.names[candidate_id])
+            similarity = matcher.ratio()
+            if similarity >= self.min_similarity and (best_id is None or similarity > best_similarity):
+                best_id = candidate_id
+                best_similarity = similarity
+
+        return None if best_id is None else self.coordinates[best_id]
+
+
+def load_gazetteer(gazetteer_path, **kwargs):
+    """Creates a gazetteer from a CSV file.
+
+    The file needs the columns `location`, `latitude` and `longitude` (e.g. a `geo_data.csv` of a previous run).
+    Delimiter (`,` or `;`) and decimal separator (`.` or `,`) are detected automatically.
+    Further keyword arguments are passed to `Gazetteer`.
+    """
+
+    with open(gazetteer_path, newline='', encoding='utf-8-sig') as gazetteer_file:
+        delimiter = csv.Sniffer().sniff(gazetteer_file.readline(), delimiters=',;').delimiter
+        gazetteer_file.seek(0)
+        reader = csv.DictReader(gazetteer_file, delimiter=delimiter)
+        gazetteer = Gazetteer(**kwargs)
+        for row in reader:
+            try:
+                latitude = float(row['latitude'].replace(',', '.'))
+                longitude = float(row['longitude'].replace(',', '.'))
+            except (AttributeError, ValueError):
+                continue
+            gazetteer.add(row['location'], latitude, longitude)
+
+    return gazetteer
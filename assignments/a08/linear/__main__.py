@@ -6,7 +6,13 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from sklearn import linear_model
+from scipy.stats import loguniform
 from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.model_selection import GridSearchCV, RandomizedSearchCV, StratifiedKFold
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from features.store import INPUT_COLUMNS, LOGISTIC_INPUT_COLUMNS, get_feature_dir, get_usecols, iter_feature_chunks, load_feature_frame, load_features, read_labeled_frame
+from linear.model import save_model, score
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -27,8 +33,50 @@ def parse_arguments():
         help="Train the logistic regression model and perform fitness test on given data.",
         default=None)
     parser.add_argument('-v', '--visualize-fraction',
-        help="Visualize fraction of canceled trains.",
+        help="Visualize fraction of canceled and delayed trains.",
         action='store_true')
+    parser.add_argument('-k', '--split-key',
+        help="Columns whose values decide the split of a row. All columns if unset.",
+        nargs='+', default=None)
+    parser.add_argument('-cd', '--cutoff-date',
+        help="Split data by date instead of by hash: rows before the given date (YYYY-MM-DD) become training data.",
+        default=None)
+    parser.add_argument('--chunk-size',
+        help="Number of rows read at once.",
+        default=1000000, type=int)
+    parser.add_argument('-i', '--incremental',
+        help="Train with -t or -tl chunk by chunk with a stochastic gradient descent model, without loading the data at once.",
+        action='store_true')
+    parser.add_argument('--epochs',
+        help="Number of passes over the training data in incremental training.",
+        default=5, type=int)
+    parser.add_argument('-fs', '--feature-store',
+        help="Directory of the feature store. If set, features are loaded from float32 arrays materialized there once.",
+        default=None)
+    parser.add_argument('-hs', '--hyperparameter-search',
+        help="Search the hyperparameters of the logistic regression model on the data with cross-validation.",
+        action='store_true')
+    parser.add_argument('--folds',
+        help="Number of cross-validation folds of the hyperparameter search.",
+        default=5, type=int)
+    parser.add_argument('--search-iterations',
+        help="Number of random parameter combinations to evaluate. A full grid search is performed if 0.",
+        default=0, type=int)
+    parser.add_argument('--scoring',
+        help="Scikit-learn scoring used to rank parameter combinations (e.g. accuracy, roc_auc, f1).",
+        default='accuracy')
+    parser.add_argument('-j', '--jobs',
+        help="Number of parallel processes of the hyperparameter search. All CPUs if -1.",
+        default=-1, type=int)
+    parser.add_argument('-d', '--density-bins',
+        help="Plot results of -t and -tl as density images with the given number of bins per axis instead of scatter plots.",
+        default=None, type=int)
+    parser.add_argument('-m', '--model-path',
+        help="Save the model trained with -t or -tl to the given file.",
+        default=None)
+    parser.add_argument('-sc', '--score',
+        help="Predict the delay (linear model) or delay probability (logistic model) of every row in the data with the model saved in the given file.",
+        dest='score_model_path', default=None)
     
     return parser.parse_args()
 
@@ -48,119 +96,151 @@ def get_label(label_id):
     return mapper[label_id]
 
 
-def split(data_path, output_dir, training_fraction):
-    """Splits data into training and test data, respecting the given fraction for training data."""
+def is_training_row(chunk, training_fraction, key_columns=None, cutoff_date=None):
+    """Returns a boolean Series marking the rows of a chunk which belong to the training data.
+
+    Without `cutoff_date`, rows are assigned by a stable hash of their `key_columns` values, so the assignment
+    does not depend on chunking, row order or the run. Otherwise rows dated before `cutoff_date` are training data.
+    """
+
+    if cutoff_date is not None:
+        return pd.to_datetime(chunk['date'], format='%d/%m/%Y') < pd.Timestamp(cutoff_date)
+
+    key = chunk if key_columns is None else chunk[key_columns]
+    hashes = pd.util.hash_pandas_object(key, index=False).values
+    return pd.Series((hashes % 2**32) / 2**32 < training_fraction, index=chunk.index)
+
+
+def split(data_path, output_dir, training_fraction, key_columns=None, cutoff_date=None, chunk_size=1000000):
+    """Splits data into training and test data, respecting the given fraction for training data.
+    The data is streamed in chunks and every row is assigned deterministically (see `is_training_row()`).
+    """
 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    data = pd.read_csv(data_path)
+    timestamp = datetime.strftime(datetime.now(), '%Y%m%d-%H%M%S')
+    training_data_path = os.path.join(output_dir, '{}_data_training.csv'.format(timestamp))
+    test_data_path = os.path.join(output_dir, '{}_data_test.csv'.format(timestamp))
+
+    training_rows = 0
+    test_rows = 0
 
     print("Splitting data...")
-    training_data = data.sample(frac=training_fraction)
-    test_data = pd.concat([data, training_data]).drop_duplicates(keep=False)
+    with open(training_data_path, 'w', newline='') as training_output, open(test_data_path, 'w', newline='') as test_output:
+        # values are kept as read, so the output is a lossless row-wise split of the input and hashes do not depend on inferred types
+        chunks = pd.read_csv(data_path, dtype=str, keep_default_na=False, chunksize=chunk_size)
+        for chunk_index, chunk in enumerate(chunks):
+            is_training = is_training_row(chunk, training_fraction, key_columns, cutoff_date)
+            chunk[is_training].to_csv(training_output, index=False, header=chunk_index==0, line_terminator='\n')
+            chunk[~is_training].to_csv(test_output, index=False, header=chunk_index==0, line_terminator='\n')
+            training_rows += int(is_training.sum())
+            test_rows += len(chunk.index) - int(is_training.sum())
 
-    timestamp = datetime.strftime(datetime.now(), '%Y%m%d-%H%M%S')
-    
-    print("Writing data...")
-    training_data.to_csv(os.path.join(output_dir, '{}_data_training.csv'.format(timestamp)), index=False)
-    test_data.to_csv(os.path.join(output_dir, '{}_data_test.csv'.format(timestamp)), index=False)
+    print("Splitting finished. {} training rows, {} test rows.".format(training_rows, test_rows))
 
-    print("Splitting finished.")
 
+def is_delayed(dataframe):
+    """Returns binary values (0, 1) with 1 meaning a delay of >=15 min or cancellation of train."""
+    return ((dataframe['delay'] >= 15) | (dataframe['canceled'] > 0)).astype(int).values
 
-def visualize(data_path):
-    """Visualize given data."""
-    
-    print("Loading data...")
-    raw_data = pd.read_csv(data_path)
-    
-    base_columns = [
-        # 'date','departure_at','arrival_at','train',# 'delay','canceled',
-        'tt_tu','rf_tu','r1','p_std','f','fx_911'
-    ]
-    input_columns = [
-        # 'date','departure_at','arrival_at','train',# 'delay','canceled',
-        'start_tt_tu','end_tt_tu','start_rf_tu','end_rf_tu','start_r1','end_r1',
-        'start_p_std','end_p_std','start_f','end_f','start_fx_911','end_fx_911'
-    ]
-    output_column = 'canceled'
 
-    data = raw_data[~raw_data.isnull().any(axis=1)]
-    data.loc[data['canceled'] > 0, 'canceled'] = 1
+def load_delay_data(data_path, feature_store_dir=None):
+    """Returns (input : DataFrame, delay : Series) of all trains that were not canceled and have no missing input, delay or canceled values.
+    Loaded from the feature store if `feature_store_dir` is set.
+    """
 
-    # Plot outputs
-    for index, base_column in enumerate(base_columns):
-        plt.figure(index)
+    if feature_store_dir is not None:
+        return load_feature_frame(data_path, INPUT_COLUMNS, 'delay', feature_store_dir)
+    return read_labeled_frame(data_path, INPUT_COLUMNS, 'delay')
 
-        for prefix in ["start", "end"]:
-            column = "{}_{}".format(prefix, base_column)
 
-            count = data.loc[data['canceled'] == (1 if prefix=="start" else 2)].groupby(column).size()
-            count_total = data.groupby(column).size()
+def load_delayed_data(data_path, feature_store_dir=None):
+    """Returns DataFrame with the logistic input columns and column `delayed` (see `is_delayed()`) of all rows without missing input, delay or canceled values.
+    Loaded from the feature store if `feature_store_dir` is set.
+    """
 
-            for index in count_total.index:
-                try:
-                    number = count[index]
-                except KeyError:
-                    number = 0
-                count_total[index] = number / count_total[index]
+    if feature_store_dir is not None:
+        data_input, data_output = load_feature_frame(data_path, LOGISTIC_INPUT_COLUMNS, 'delayed', feature_store_dir)
+    else:
+        data_input, data_output = read_labeled_frame(data_path, LOGISTIC_INPUT_COLUMNS, 'delayed')
+    return data_input.assign(delayed=data_output.values.astype(int))
 
-            plt.plot(count_total, color="blue" if prefix=="start" else "red", alpha=0.5)
 
-        plt.xlabel(get_label(base_column))
-        plt.ylabel("Anteil ausgefallener Züge")
+BASE_COLUMNS = ['tt_tu','rf_tu','r1','p_std','f','fx_911']
 
-        plt.xticks(())
-        plt.yticks(())
 
-    plt.show()
+def aggregate_rates(data_path, stepsize=1, chunk_size=1000000):
+    """Returns the number of journeys and the rates of canceled and delayed trains (see `is_delayed()`) per bin of every weather variable.
+
+    All variables are aggregated at once: the chunks are reshaped into (variable, bin) pairs and reduced with one group operation.
+
+    Returns
+    -------
+    DataFrame indexed by (variable, bin) with the columns `total`, `canceled`, `delayed`, `canceled_rate` and `delayed_rate`.
+
+    Raises
+    ------
+    ValueError
+        If the file has no rows with weather values.
+    """
+
+    weather_columns = ['{}_{}'.format(prefix, column) for column in BASE_COLUMNS for prefix in ['start', 'end']]
+    counts = None
+
+    for chunk in pd.read_csv(data_path, usecols=weather_columns + ['delay', 'canceled'], chunksize=chunk_size):
+        chunk = chunk.assign(
+            canceled=(chunk['canceled'] > 0).astype(int),
+            delayed=is_delayed(chunk.fillna({'delay': 0, 'canceled': 0})))
+        long_chunk = chunk.melt(id_vars=['canceled', 'delayed'], value_vars=weather_columns, var_name='variable').dropna()
+        long_chunk['bin'] = np.floor(long_chunk['value'] / stepsize) * stepsize
+        chunk_counts = long_chunk.groupby(['variable', 'bin']).agg(
+            total=('value', 'size'), canceled=('canceled', 'sum'), delayed=('delayed', 'sum'))
+        counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+
+    if counts is None or counts.empty:
+        raise ValueError("Cannot aggregate rates, {} has no rows with weather values.".format(data_path))
+
+    counts['canceled_rate'] = counts['canceled'] / counts['total']
+    counts['delayed_rate'] = counts['delayed'] / counts['total']
+    return counts
 
 
-def visualize(data_path):
+def load_rates(data_path, stepsize=1, feature_store_dir=None, chunk_size=1000000):
+    """Returns the result of `aggregate_rates()`, cached in the feature store (next to the data file if unset)."""
+
+    cache_dir = get_feature_dir(data_path, BASE_COLUMNS, 'rates_{}'.format(stepsize), feature_store_dir)
+    cache_path = os.path.join(cache_dir, 'rates.csv')
+
+    if os.path.isfile(cache_path):
+        print("Using cached rates...")
+        return pd.read_csv(cache_path, index_col=['variable', 'bin'])
+
+    print("Aggregating data...")
+    rates = aggregate_rates(data_path, stepsize, chunk_size)
+    os.makedirs(cache_dir, exist_ok=True)
+    rates.to_csv(cache_path)
+    return rates
+
+
+def visualize(data_path, feature_store_dir=None, chunk_size=1000000):
     """Visualize given data."""
     
-    print("Loading data...")
-    raw_data = pd.read_csv(data_path)
-    
-    base_columns = [
-        # 'date','departure_at','arrival_at','train',# 'delay','canceled',
-        'tt_tu','rf_tu','r1','p_std','f','fx_911'
-    ]
-    input_columns = [
-        # 'date','departure_at','arrival_at','train',# 'delay','canceled',
-        'start_tt_tu','end_tt_tu','start_rf_tu','end_rf_tu','start_r1','end_r1',
-        'start_p_std','end_p_std','start_f','end_f','start_fx_911','end_fx_911'
-    ]
-    output_column = 'canceled'
-
-    data = raw_data[~raw_data.isnull().any(axis=1)]
-    data.loc[data['canceled'] > 0, 'canceled'] = 1
+    stepsize = 1
+    rates = load_rates(data_path, stepsize, feature_store_dir, chunk_size)
 
     # Plot outputs
-    for index, base_column in enumerate(base_columns):
+    for index, base_column in enumerate(BASE_COLUMNS):
         plt.figure(index)
 
         for prefix in ["start"]:
-            column = "{}_{}".format(prefix, base_column)
-
-            stepsize = 1
-            bins = np.arange(data[column].min(), data[column].max() + stepsize, stepsize)
-            groups = pd.cut(data[column], bins=bins, labels=bins[:-1])
-            count = data.loc[data['canceled'] == (1 if prefix=="start" else 2)].groupby(groups).size()
-            count_total = data.groupby(groups).size()
+            column_rates = rates.loc["{}_{}".format(prefix, base_column)]
 
-            for index in count_total.index:
-                try:
-                    number = count[index]
-                except KeyError:
-                    number = 0
-                count_total[index] = number / count_total[index]
-
-            plt.bar(count_total.index, count_total.values, width=stepsize*0.8, color="blue" if prefix=="start" else "red", alpha=0.5)
+            plt.bar(column_rates.index, column_rates['canceled_rate'], width=stepsize*0.8, color="blue" if prefix=="start" else "red", alpha=0.5)
+            plt.plot(column_rates.index, column_rates['delayed_rate'], color="orange", alpha=0.8)
 
         plt.xlabel(get_label(base_column))
-        plt.ylabel("Anteil ausgefallener Züge")
+        plt.ylabel("Anteil ausgefallener (Balken) und verspäteter (Linie) Züge")
 
         plt.xticks(())
         plt.yticks(())
@@ -168,48 +248,67 @@ def visualize(data_path):
     plt.show()
 
 
-def test(training_data_path, test_data_path):
+def get_binned_mean(x, y, bins):
+    """Returns the mean of `y` per bin of `x`. NaN for empty bins."""
+
+    sums, _ = np.histogram(x, bins=bins, weights=y)
+    counts, _ = np.histogram(x, bins=bins)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return sums / counts
+
+
+def plot_density(x, y, bins=200, cmap='Greys', mean_y=None, mean_color='red'):
+    """Plots the number of points per cell of a grid as image instead of drawing every point.
+
+    Parameters
+    ----------
+    x, y : array
+        Coordinates of the points.
+    bins : int
+        Number of cells per axis.
+    cmap : str
+        Matplotlib colormap of the image. Empty cells are transparent, so several images can be overlaid.
+    mean_y : array
+        Values (e.g. predictions) of the points whose mean per bin of `x` is drawn as line. No line if unset.
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins)
+
+    # logarithmic scale keeps sparse cells visible next to dense ones
+    image = np.ma.masked_equal(np.log1p(counts.T), 0)
+    plt.imshow(image, origin='lower', aspect='auto', interpolation='nearest', cmap=cmap,
+        extent=(x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]))
+
+    if mean_y is not None:
+        x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+        plt.plot(x_centers, get_binned_mean(x, np.asarray(mean_y, dtype=np.float64), x_edges), color=mean_color, linewidth=1)
+
+
+def test(training_data_path, test_data_path, feature_store_dir=None, density_bins=None, model_path=None):
     """Perform linear regression on data and test fitness."""
 
     model = linear_model.LinearRegression()
     
     print("Loading data...")
-    training_data = pd.read_csv(training_data_path)
-    test_data = pd.read_csv(test_data_path)
+    training_data_input, training_data_output = load_delay_data(training_data_path, feature_store_dir)
+    test_data_input, test_data_output = load_delay_data(test_data_path, feature_store_dir)
     
     base_columns = [
         # 'date','departure_at','arrival_at','train',# 'delay','canceled',
         'tt_tu','rf_tu','r1','p_std','f','fx_911'
     ]
-    input_columns = [
-        # 'date','departure_at','arrival_at','train',# 'delay','canceled',
-        'start_tt_tu','end_tt_tu','start_rf_tu','end_rf_tu','start_r1','end_r1',
-        'start_p_std','end_p_std','start_f','end_f','start_fx_911','end_fx_911'
-    ]
+    input_columns = INPUT_COLUMNS
     output_column = 'delay'
-
-    print("Portioning data...")
-    training_data_without_nan = training_data[~training_data.isnull().any(axis=1)]
-    training_data_without_nan = training_data_without_nan[training_data_without_nan['canceled'] == 0]
-    training_data_input = training_data_without_nan[input_columns]
-    training_data_output = training_data_without_nan[output_column]
-
-    # Turn dense data frame into sparse data frame. See https://stackoverflow.com/a/70601233/8325653
-    sparse_training_data = training_data_input.astype(pd.SparseDtype("float64",0)).sparse.to_coo().tocsr()
     
     print("Training model...")
-    model.fit(sparse_training_data, training_data_output.values)
-
-    test_data_without_nan = test_data[~test_data.isnull().any(axis=1)]
-    test_data_without_nan = test_data_without_nan[test_data_without_nan['canceled'] == 0]
-    test_data_input = test_data_without_nan[input_columns]
-    test_data_output = test_data_without_nan[output_column]
-
-    # Turn dense data frame into sparse data frame. See https://stackoverflow.com/a/70601233/8325653
-    sparse_test_data = test_data_input.astype(pd.SparseDtype("float64",0)).sparse.to_coo().tocsr()
+    model.fit(training_data_input.to_numpy(dtype=np.float32), training_data_output.values)
+    if model_path is not None:
+        save_model(model_path, model, input_columns, output_column)
 
     print("Testing model...")
-    prediction = model.predict(sparse_test_data)
+    prediction = model.predict(test_data_input.to_numpy(dtype=np.float32))
 
     # The coefficients
     print("Coefficients: \n", model.coef_)
@@ -225,11 +324,15 @@ def test(training_data_path, test_data_path):
         start_column = "start_{}".format(column)
         end_column = "end_{}".format(column)
 
-        size = 2
-        plt.scatter(test_data_input[start_column], test_data_output, color="black", alpha=0.5, s=size)
-        plt.scatter(test_data_input[end_column], test_data_output, color="green", alpha=0.5, s=size)
-        plt.scatter(test_data_input[start_column], prediction, color="blue", alpha=0.5, s=size)
-        plt.scatter(test_data_input[end_column], prediction, color="red", alpha=0.5, s=size)
+        if density_bins:
+            plot_density(test_data_input[start_column], test_data_output, density_bins, cmap="Greys", mean_y=prediction, mean_color="blue")
+            plot_density(test_data_input[end_column], test_data_output, density_bins, cmap="Greens", mean_y=prediction, mean_color="red")
+        else:
+            size = 2
+            plt.scatter(test_data_input[start_column], test_data_output, color="black", alpha=0.5, s=size)
+            plt.scatter(test_data_input[end_column], test_data_output, color="green", alpha=0.5, s=size)
+            plt.scatter(test_data_input[start_column], prediction, color="blue", alpha=0.5, s=size)
+            plt.scatter(test_data_input[end_column], prediction, color="red", alpha=0.5, s=size)
 
         # show mean per sensor value
         # mean_df = test_data_without_nan.groupby(start_column).mean()
@@ -245,16 +348,9 @@ def test(training_data_path, test_data_path):
     plt.show()
 
 
-def test_log(training_data_path, test_data_path):
+def test_log(training_data_path, test_data_path, feature_store_dir=None, density_bins=None, model_path=None):
     """Perform logistic regression on data and test fitness."""
 
-    def convertToDelayed(dataframe):
-        """Returns a dataframe with column `delayed` with binary value (0, 1) with 1 meaning a delay of >=15 min or cancellation of train."""
-        df = dataframe.copy()
-        df['delayed'] = 0
-        df.loc[(df['delay'] >= 15) | (df['canceled'] > 0), 'delayed'] = 1
-        return df
-
     def getEqualSample(dataframe, column, binSize):
         """Returns dataframe with equal number of data points per bin."""
         bins = np.arange(dataframe[column].min(), dataframe[column].max() + binSize, binSize)
@@ -270,48 +366,30 @@ def test_log(training_data_path, test_data_path):
     model = linear_model.LogisticRegression(C=1.2, penalty='l1', solver='saga')
     
     print("Loading data...")
-    training_data = pd.read_csv(training_data_path)
-    test_data = pd.read_csv(test_data_path)
+    training_data = load_delayed_data(training_data_path, feature_store_dir)
+    test_data = load_delayed_data(test_data_path, feature_store_dir)
     
     base_columns = [
         # 'date','departure_at','arrival_at','train',# 'delay','canceled',
         'tt_tu',# 'rf_tu','r1','p_std','f','fx_911'
     ]
-    input_columns = [
-        # 'date','departure_at','arrival_at','train','delay','canceled',
-        'start_tt_tu',
-        'end_tt_tu',
-        'start_rf_tu',
-        'end_rf_tu',
-        # 'start_r1',
-        # 'end_r1',
-        # 'start_p_std',
-        # 'end_p_std',
-        'start_f',
-        'end_f',
-        'start_fx_911',
-        'end_fx_911'
-    ]
+    input_columns = LOGISTIC_INPUT_COLUMNS
     output_column = 'delayed'
 
     print("Portioning data...")
-    training_data_without_nan, groups, bins = getEqualSample(convertToDelayed(training_data[~training_data.isnull().any(axis=1)]), input_columns[0], 5)
+    training_data_without_nan, groups, bins = getEqualSample(training_data, input_columns[0], 5)
     training_data_input = training_data_without_nan[input_columns]
     training_data_output = training_data_without_nan[output_column]
-
-    # Turn dense data frame into sparse data frame. See https://stackoverflow.com/a/70601233/8325653
-    sparse_training_data = training_data_input.astype(pd.SparseDtype("float64",0)).sparse.to_coo().tocsr()
     
     print("Training model...")
     model.fit(training_data_input, training_data_output.values)
+    if model_path is not None:
+        save_model(model_path, model, input_columns, output_column)
 
-    test_data_without_nan, _, _ = getEqualSample(convertToDelayed(test_data[~test_data.isnull().any(axis=1)]), input_columns[0], 5)
+    test_data_without_nan, _, _ = getEqualSample(test_data, input_columns[0], 5)
     test_data_input = test_data_without_nan[input_columns]
     test_data_output = test_data_without_nan[output_column]
 
-    # Turn dense data frame into sparse data frame. See https://stackoverflow.com/a/70601233/8325653
-    sparse_test_data = test_data_input.astype(pd.SparseDtype("float64",0)).sparse.to_coo().tocsr()
-
     print("Testing model...")
     prediction = model.predict_proba(test_data_input)
 
@@ -340,7 +418,10 @@ def test_log(training_data_path, test_data_path):
         # plt.scatter(test_data_input[start_column], test_data_output, color="green", alpha=0.5, s=size)
         plt.bar(bins[:-1], share, color="blue", alpha=0.5, width=stepsize*0.8)
         plt.bar(bins[:-1], total, color="green", alpha=0.5, width=stepsize*0.4)
-        plt.scatter(test_data_input[column], prediction[:,1], color="red", alpha=0.5, s=size)
+        if density_bins:
+            plot_density(test_data_input[column], prediction[:,1], density_bins, cmap="Reds", mean_y=prediction[:,1], mean_color="red")
+        else:
+            plt.scatter(test_data_input[column], prediction[:,1], color="red", alpha=0.5, s=size)
 
         # show mean per sensor value
         # mean_df = test_data_without_nan.groupby(start_column).mean()
@@ -361,20 +442,192 @@ def test_log(training_data_path, test_data_path):
     plt.show()
 
 
+def read_feature_chunks(data_path, input_columns, get_output, chunk_size, filter_rows=None):
+    """Yields (input, output) per chunk of the data. Input is a float32 matrix of `input_columns`.
+
+    Parameters
+    ----------
+    get_output : (chunk : DataFrame) => ndarray
+        Returns the output values of a chunk.
+    filter_rows : (chunk : DataFrame) => Series
+        Returns a boolean mask of the rows to keep. Rows with missing values are always dropped.
+    """
+
+    for chunk in pd.read_csv(data_path, usecols=get_usecols(input_columns), chunksize=chunk_size):
+        chunk = chunk.dropna()
+        if filter_rows is not None:
+            chunk = chunk[filter_rows(chunk)]
+        if chunk.empty:
+            continue
+        yield chunk[input_columns].to_numpy(dtype=np.float32), get_output(chunk)
+
+
+def train_incremental(model, get_chunks, epochs, **partial_fit_kwargs):
+    """Trains the model with `partial_fit()` on standardized chunks.
+
+    The first pass over the chunks fits the scaler, every further pass (epoch) the model.
+
+    Returns
+    -------
+    Pipeline of fitted scaler and model.
+    """
+
+    scaler = StandardScaler()
+    for training_input, _ in get_chunks():
+        scaler.partial_fit(training_input)
+
+    for epoch in range(epochs):
+        print("Training epoch {}/{}...".format(epoch+1, epochs))
+        for training_input, training_output in get_chunks():
+            model.partial_fit(scaler.transform(training_input), training_output, **partial_fit_kwargs)
+
+    return make_pipeline(scaler, model)
+
+
+def test_incremental(training_data_path, test_data_path, chunk_size=1000000, epochs=5, feature_store_dir=None, model_path=None):
+    """Perform linear regression on data chunk by chunk and test fitness."""
+
+    get_chunks = lambda data_path: read_feature_chunks(
+        data_path, INPUT_COLUMNS, lambda chunk: chunk['delay'].values, chunk_size,
+        filter_rows=lambda chunk: chunk['canceled'] == 0)
+    if feature_store_dir is not None:
+        get_chunks = lambda data_path: iter_feature_chunks(
+            *load_features(data_path, INPUT_COLUMNS, 'delay', feature_store_dir), chunk_size)
+
+    print("Training model...")
+    model = train_incremental(linear_model.SGDRegressor(), lambda: get_chunks(training_data_path), epochs)
+    if model_path is not None:
+        save_model(model_path, model, INPUT_COLUMNS, 'delay')
+
+    print("Testing model...")
+    rows, squared_error, output_sum, output_squared_sum = 0, 0.0, 0.0, 0.0
+    for test_data_input, test_data_output in get_chunks(test_data_path):
+        prediction = model.predict(test_data_input)
+        rows += len(test_data_output)
+        squared_error += float(((test_data_output - prediction) ** 2).sum())
+        output_sum += float(test_data_output.sum())
+        output_squared_sum += float((test_data_output.astype(np.float64) ** 2).sum())
+
+    # The coefficients (of standardized inputs)
+    print("Coefficients: \n", model[-1].coef_)
+    # The mean squared error
+    print("Mean squared error: %.2f" % (squared_error / rows))
+    # The coefficient of determination: 1 is perfect prediction
+    print("Coefficient of determination: %.2f" % (1 - squared_error / (output_squared_sum - output_sum ** 2 / rows)))
+
+
+def test_log_incremental(training_data_path, test_data_path, chunk_size=1000000, epochs=5, feature_store_dir=None, model_path=None):
+    """Perform logistic regression on data chunk by chunk and test fitness."""
+
+    get_chunks = lambda data_path: read_feature_chunks(data_path, LOGISTIC_INPUT_COLUMNS, is_delayed, chunk_size)
+    if feature_store_dir is not None:
+        get_chunks = lambda data_path: iter_feature_chunks(
+            *load_features(data_path, LOGISTIC_INPUT_COLUMNS, 'delayed', feature_store_dir), chunk_size)
+
+    print("Training model...")
+    model = train_incremental(
+        linear_model.SGDClassifier(loss='log', penalty='l1'),
+        lambda: get_chunks(training_data_path), epochs, classes=np.array([0, 1]))
+    if model_path is not None:
+        save_model(model_path, model, LOGISTIC_INPUT_COLUMNS, 'delayed')
+
+    print("Testing model...")
+    rows, correct = 0, 0
+    for test_data_input, test_data_output in get_chunks(test_data_path):
+        rows += len(test_data_output)
+        correct += int((model.predict(test_data_input) == test_data_output).sum())
+
+    # The coefficients (of standardized inputs)
+    print("Coefficients: \n", list(zip(LOGISTIC_INPUT_COLUMNS, model[-1].coef_[0])))
+    # The mean accuracy
+    print("Score: %.2f" % (correct / rows))
+
+
+def search_log(data_path, output_dir=None, feature_store_dir=None, folds=5, iterations=0, scoring='accuracy', jobs=-1):
+    """Search the hyperparameters of the logistic regression model with k-fold cross-validation in parallel.
+
+    All folds and workers read the same feature matrix: it is memory-mapped from the feature store (or by joblib
+    when loaded from CSV) instead of being copied into every worker.
+    """
+
+    print("Loading data...")
+    if feature_store_dir is not None:
+        data_input, data_output = load_features(data_path, LOGISTIC_INPUT_COLUMNS, 'delayed', feature_store_dir)
+    else:
+        data = load_delayed_data(data_path)
+        data_input, data_output = data[LOGISTIC_INPUT_COLUMNS].to_numpy(dtype=np.float32), data['delayed'].values
+
+    model = make_pipeline(StandardScaler(), linear_model.LogisticRegression(solver='saga', max_iter=1000))
+    cross_validation = StratifiedKFold(n_splits=folds, shuffle=True, random_state=0)
+    search_options = {'scoring': scoring, 'cv': cross_validation, 'n_jobs': jobs, 'pre_dispatch': 'n_jobs', 'refit': False}
+
+    if iterations > 0:
+        parameters = {
+            'logisticregression__C': loguniform(1e-3, 1e2),
+            'logisticregression__penalty': ['l1', 'l2'],
+            'logisticregression__class_weight': [None, 'balanced'],
+        }
+        search = RandomizedSearchCV(model, parameters, n_iter=iterations, random_state=0, **search_options)
+    else:
+        parameters = {
+            'logisticregression__C': [0.01, 0.1, 1, 1.2, 10, 100],
+            'logisticregression__penalty': ['l1', 'l2'],
+            'logisticregression__class_weight': [None, 'balanced'],
+        }
+        search = GridSearchCV(model, parameters, **search_options)
+
+    print("Searching hyperparameters...")
+    search.fit(data_input, data_output)
+
+    results = pd.DataFrame(search.cv_results_)
+    results['params'] = results['params'].apply(
+        lambda params: ', '.join('{}={}'.format(key.split('__')[-1], value) for key, value in params.items()))
+    results = results.sort_values('rank_test_score')[[
+        'rank_test_score', 'mean_test_score', 'std_test_score', 'mean_fit_time', 'std_fit_time', 'mean_score_time', 'params'
+    ]]
+
+    with pd.option_context('display.max_colwidth', None, 'display.width', None):
+        print(results.to_string(index=False))
+
+    if output_dir is not None:
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        timestamp = datetime.strftime(datetime.now(), '%Y%m%d-%H%M%S')
+        results_path = os.path.join(output_dir, '{}_search_results.csv'.format(timestamp))
+        results.to_csv(results_path, index=False)
+        print("Results written to {}".format(results_path))
+
+
 def main():
     args = parse_arguments()
 
-    if not args.split_fraction == -1:
-        split(args.data_path, args.output_dir, args.split_fraction)
+    if not args.split_fraction == -1 or args.cutoff_date is not None:
+        split(args.data_path, args.output_dir, args.split_fraction, args.split_key, args.cutoff_date, args.chunk_size)
+
+    elif args.score_model_path is not None:
+        output_dir = args.output_dir or os.path.dirname(args.data_path)
+        output_path = os.path.join(output_dir, '{}_scores.csv'.format(os.path.splitext(os.path.basename(args.data_path))[0]))
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        score(args.data_path, args.score_model_path, output_path, args.chunk_size)
+
+    elif args.hyperparameter_search:
+        search_log(args.data_path, args.output_dir, args.feature_store, args.folds, args.search_iterations, args.scoring, args.jobs)
 
     elif args.visualize_fraction:
-        visualize(args.data_path)
+        visualize(args.data_path, args.feature_store, args.chunk_size)
+
+    elif args.test_logistic_data_path and args.incremental:
+        test_log_incremental(args.data_path, args.test_logistic_data_path, args.chunk_size, args.epochs, args.feature_store, args.model_path)
 
     elif args.test_logistic_data_path:
-        test_log(args.data_path, args.test_logistic_data_path)
+        test_log(args.data_path, args.test_logistic_data_path, args.feature_store, args.density_bins, args.model_path)
+
+    elif args.test_data_path is not None and args.incremental:
+        test_incremental(args.data_path, args.test_data_path, args.chunk_size, args.epochs, args.feature_store, args.model_path)
 
     elif args.test_data_path is not None:
-        test(args.data_path, args.test_data_path)
+        test(args.data_path, args.test_data_path, args.feature_store, args.density_bins, args.model_path)
 
 if __name__ == '__main__':
     main()
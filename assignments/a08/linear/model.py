@@ -0,0 +1,91 @@
+import os
+import joblib
+import numpy as np
+import pandas as pd
+
+ARTIFACT_VERSION = 1
+
+# columns copied from the scored data to the predictions if present, identify the journey
+KEY_COLUMNS = ['date', 'departure_at', 'arrival_at', 'train', 'start_station', 'end_station']
+
+
+def save_model(model_path, model, input_columns, label):
+    """Saves a fitted model together with everything needed to score new data.
+
+    Parameters
+    ----------
+    model : estimator
+        Fitted scikit-learn model or pipeline including its preprocessing (e.g. a scaler).
+    input_columns : str[]
+        Columns of the merged data the model was trained on, in training order.
+    label : str
+        Predicted label, `delay` (regression) or `delayed` (classification).
+    """
+
+    model_dir = os.path.dirname(model_path)
+    if model_dir:
+        os.makedirs(model_dir, exist_ok=True)
+
+    joblib.dump({
+        'version': ARTIFACT_VERSION,
+        'model': model,
+        'input_columns': list(input_columns),
+        'label': label,
+    }, model_path)
+    print("Model written to {}".format(model_path))
+
+
+def load_model(model_path):
+    """Returns the artifact saved by `save_model()` as dict with the keys `model`, `input_columns` and `label`."""
+
+    artifact = joblib.load(model_path)
+    if not isinstance(artifact, dict) or not artifact.get('version') == ARTIFACT_VERSION:
+        raise ValueError("{} is no model saved by this version.".format(model_path))
+    return artifact
+
+
+def predict_chunk(artifact, chunk):
+    """Returns the predictions for all rows of a chunk of merged data. NaN for rows with missing input values.
+
+    Classifiers predict the probability of the positive class, regressors the label value.
+    """
+
+    model = artifact['model']
+    data_input = chunk[artifact['input_columns']].astype(np.float32)
+    valid = data_input.notnull().all(axis=1).values
+    prediction = np.full(len(chunk.index), np.nan)
+    if not valid.any():
+        return prediction
+
+    # keep feature names only for models fitted on a DataFrame, avoids warnings of scikit-learn
+    data_input = data_input[valid] if hasattr(model, 'feature_names_in_') else data_input.values[valid]
+    if hasattr(model, 'predict_proba'):
+        prediction[valid] = model.predict_proba(data_input)[:, 1]
+    else:
+        prediction[valid] = model.predict(data_input)
+    return prediction
+
+
+def score(data_path, model_path, output_path, chunk_size=1000000):
+    """Predicts every row of a merged data file chunk by chunk with a saved model.
+
+    The output contains the journey columns of `KEY_COLUMNS` found in the data and the column `predicted_<label>`.
+    """
+
+    artifact = load_model(model_path)
+    header = pd.read_csv(data_path, nrows=0).columns
+    key_columns = [column for column in KEY_COLUMNS if column in header]
+    missing_columns = [column for column in artifact['input_columns'] if column not in header]
+    if missing_columns:
+        raise ValueError("Columns missing in {}: {}".format(data_path, ', '.join(missing_columns)))
+
+    output_column = 'predicted_{}'.format(artifact['label'])
+    rows = 0
+
+    print("Scoring {}...".format(data_path))
+    for chunk in pd.read_csv(data_path, usecols=key_columns + artifact['input_columns'], chunksize=chunk_size):
+        predictions = chunk[key_columns].assign(**{output_column: predict_chunk(artifact, chunk)})
+        predictions.to_csv(output_path, mode='w' if rows == 0 else 'a', header=rows == 0, index=False)
+        rows += len(chunk.index)
+
+    print("{} predictions written to {}".format(rows, output_path))
@@ -1,10 +1,12 @@
 import argparse
 from datetime import datetime
 import os
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from sklearn import linear_model
 from sklearn.metrics import mean_squared_error, r2_score
+from features.store import INPUT_COLUMNS, load_feature_frame, read_labeled_frame
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -18,6 +20,9 @@ def parse_arguments():
     parser.add_argument('-t', '--test-data-path',
         help="Train the model and perform fitness test on given data.",
         default=None)
+    parser.add_argument('-fs', '--feature-store',
+        help="Directory of the feature store. If set, features are loaded from float32 arrays materialized there once.",
+        default=None)
     
     return parser.parse_args()
 
@@ -36,46 +41,36 @@ def get_label(label_id):
     return mapper[label_id]
 
 
-def test(training_data_path, test_data_path):
+def load_data(data_path, feature_store_dir=None):
+    """Returns (input : DataFrame, canceled : Series) of all rows without missing input, delay or canceled values.
+    Loaded from the feature store if `feature_store_dir` is set.
+    """
+
+    if feature_store_dir is not None:
+        return load_feature_frame(data_path, INPUT_COLUMNS, 'canceled', feature_store_dir)
+    return read_labeled_frame(data_path, INPUT_COLUMNS, 'canceled')
+
+
+def test(training_data_path, test_data_path, feature_store_dir=None):
     """Perform logistic regression on data and test fitness."""
 
     model = linear_model.LinearRegression()
     
     print("Loading data...")
-    training_data = pd.read_csv(training_data_path)
-    test_data = pd.read_csv(test_data_path)
+    training_data_input, training_data_output = load_data(training_data_path, feature_store_dir)
+    test_data_input, test_data_output = load_data(test_data_path, feature_store_dir)
     
     base_columns = [
         # 'date','departure_at','arrival_at','train',# 'delay','canceled',
         'tt_tu','rf_tu','r1','p_std','f','fx_911'
     ]
-    input_columns = [
-        # 'date','departure_at','arrival_at','train',# 'delay','canceled',
-        'start_tt_tu','end_tt_tu','start_rf_tu','end_rf_tu','start_r1','end_r1',
-        'start_p_std','end_p_std','start_f','end_f','start_fx_911','end_fx_911'
-    ]
     output_column = 'canceled'
-
-    print("Portioning data...")
-    training_data_without_nan = training_data[~training_data.isnull().any(axis=1)]
-    training_data_input = training_data_without_nan[input_columns]
-    training_data_output = training_data_without_nan[output_column]
-
-    # Turn dense data frame into sparse data frame. See https://stackoverflow.com/a/70601233/8325653
-    sparse_training_data = training_data_input.astype(pd.SparseDtype("float64",0)).sparse.to_coo().tocsr()
     
     print("Training model...")
-    model.fit(sparse_training_data, training_data_output.values)
-
-    test_data_without_nan = test_data[~test_data.isnull().any(axis=1)]
-    test_data_input = test_data_without_nan[input_columns]
-    test_data_output = test_data_without_nan[output_column]
-
-    # Turn dense data frame into sparse data frame. See https://stackoverflow.com/a/70601233/8325653
-    sparse_test_data = test_data_input.astype(pd.SparseDtype("float64",0)).sparse.to_coo().tocsr()
+    model.fit(training_data_input.to_numpy(dtype=np.float32), training_data_output.values)
 
     print("Testing model...")
-    prediction = model.predict(sparse_test_data)
+    prediction = model.predict(test_data_input.to_numpy(dtype=np.float32))
 
     # The coefficients
     print("Coefficients: \n", model.coef_)
@@ -108,11 +103,8 @@ def test(training_data_path, test_data_path):
 def main():
     args = parse_arguments()
 
-    if not args.split_fraction == -1:
-        split(args.data_path, args.output_dir, args.split_fraction)
-
-    elif args.test_data_path is not None:
-        test(args.data_path, args.test_data_path)
+    if args.test_data_path is not None:
+        test(args.data_path, args.test_data_path, args.feature_store)
 
 if __name__ == '__main__':
     main()
@@ -1,10 +1,13 @@
 import argparse
+import csv
 from datetime import datetime
+import io
 import math
 import os
 import random
 import shutil
 from numpy import NaN
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
@@ -47,10 +50,59 @@ def parse_arguments():
     parser.add_argument('-a', '--annotate-climate',
         help="Annotate the climate data with the nearest train station.",
         action='store_true')
+    parser.add_argument('-i', '--index-routes',
+        help="Build the route index for all merged data files in bahn_data_dir that do not have one yet.",
+        action='store_true')
+    parser.add_argument('--start-station',
+        help="Start station of the route to reduce to.",
+        default='Düsseldorf Hbf')
+    parser.add_argument('--end-station',
+        help="End station of the route to reduce to.",
+        default='Duisburg Hbf')
+    parser.add_argument('--chunk-size',
+        help="Number of rows read at once when reducing files without route index.",
+        default=1000000, type=int)
     
     return parser.parse_args()
 
 
+ROUTE_INDEX_SUFFIX = '_route_index.csv'
+ROUTE_COLUMNS = ['start_station', 'end_station']
+
+
+def get_route_index_path(data_path):
+    """Returns the path of the route index belonging to a merged data file."""
+
+    return os.path.splitext(data_path)[0] + ROUTE_INDEX_SUFFIX
+
+
+def is_route_index(file_path):
+    return file_path.endswith(ROUTE_INDEX_SUFFIX)
+
+
+def read_header(data_path):
+    """Returns the column names of a CSV file."""
+
+    with open(data_path, encoding='utf-8', newline='') as data_file:
+        return next(csv.reader(data_file), [])
+
+
+def read_route_index(data_path):
+    """Returns the route index of a merged data file as DataFrame.
+
+    Returns None if there is no index or if it is outdated, i.e. older than the data file or not covering it up to its end.
+    """
+
+    route_index_path = get_route_index_path(data_path)
+    if not os.path.isfile(route_index_path) or os.path.getmtime(route_index_path) < os.path.getmtime(data_path):
+        return None
+
+    route_index = pd.read_csv(route_index_path)
+    if len(route_index.index) and not (route_index['offset'] + route_index['length']).max() == os.path.getsize(data_path):
+        return None
+    return route_index
+
+
 def get_climate_geo_map(climate_data_dir, geo_data_path, mapping_data_path=''):
     """Creates DataFrame mapping a climate station to the closes train station. Returns path to DataFrame."""
 
@@ -173,6 +225,135 @@ def partition(bahn_data_dir, number_of_partitions):
 
 
 
+def iter_csv_rows(data_file):
+    """Yields (row, offset, length) of every CSV row of a binary file, starting at its current position.
+
+    One reader is used for the whole file, so a row may span several lines if quoted values contain line breaks.
+    Offsets are taken from the file position, the reader only pulls the lines of the current row.
+    """
+
+    reader = csv.reader(line.decode('utf-8') for line in iter(data_file.readline, b''))
+    offset = data_file.tell()
+    for row in reader:
+        length = data_file.tell() - offset
+        yield row, offset, length
+        offset += length
+
+
+def to_indexed_csv(bahn_data, offset, header):
+    """Converts bahn data to CSV, grouping the rows of a route into one contiguous block.
+
+    Parameters
+    ----------
+    bahn_data : DataFrame
+        Data to convert.
+    offset : int
+        Byte position in the output file at which the CSV will be written.
+    header : bool
+        If true, the CSV starts with a header line.
+
+    Returns
+    -------
+    (content : bytes, route_index : DataFrame)
+        UTF-8 encoded CSV and one route index entry (start_station, end_station, offset, length, rows) per block.
+    """
+
+    # stable sort keeps the original order of the journeys within a route
+    bahn_data = bahn_data.sort_values(ROUTE_COLUMNS, kind='mergesort')
+    content = bahn_data.to_csv(index=False, header=header, line_terminator='\n').encode('utf-8')
+
+    line_ends = np.flatnonzero(np.frombuffer(content, dtype=np.uint8) == ord('\n')) + 1
+    line_starts = np.concatenate([[0], line_ends[:-1]])
+    if not len(line_ends) == len(bahn_data.index) + int(header):
+        # values contain line breaks, rows have to be parsed to find their ends
+        row_offsets = [(row_offset, length) for _, row_offset, length in iter_csv_rows(io.BytesIO(content))]
+        line_starts = np.array([row_offset for row_offset, _ in row_offsets], dtype=int)
+        line_ends = line_starts + np.array([length for _, length in row_offsets], dtype=int)
+    if header:
+        line_starts, line_ends = line_starts[1:], line_ends[1:]
+
+    routes = bahn_data[ROUTE_COLUMNS].reset_index(drop=True)
+    # NaN never equals NaN, rows without station would each start a new block
+    filled_routes = routes.fillna('')
+    block_starts = np.flatnonzero((filled_routes != filled_routes.shift()).any(axis=1).values)
+    block_ends = np.append(block_starts[1:], len(routes.index)).astype(int)
+
+    route_index = pd.DataFrame({
+        'start_station': routes['start_station'].values[block_starts],
+        'end_station': routes['end_station'].values[block_starts],
+        'offset': offset + line_starts[block_starts],
+        'length': line_ends[block_ends - 1] - line_starts[block_starts],
+        'rows': block_ends - block_starts,
+    })
+
+    return content, route_index
+
+
+def build_route_index(data_path):
+    """Creates the route index of an already merged data file by scanning it once.
+
+    Consecutive rows of the same route are combined into one index entry.
+    """
+
+    entries = []
+
+    with open(data_path, 'rb') as data_file:
+        rows = iter_csv_rows(data_file)
+        header = next(rows)[0]
+        start_column, end_column = [header.index(column) for column in ROUTE_COLUMNS]
+
+        for row, offset, length in tqdm(rows):
+            route = [row[start_column], row[end_column]]
+            if entries and entries[-1][:2] == route:
+                entries[-1][3] += length
+                entries[-1][4] += 1
+            else:
+                entries.append([route[0], route[1], offset, length, 1])
+
+    route_index = pd.DataFrame(entries, columns=ROUTE_COLUMNS + ['offset', 'length', 'rows'])
+    route_index.to_csv(get_route_index_path(data_path), index=False)
+
+
+def index_routes(bahn_data_dir):
+    """Builds the route index for all merged data files in the given directory that do not have a current one."""
+
+    filenames = [filename for filename in os.listdir(bahn_data_dir) if not is_route_index(filename)]
+    for file_index, filename in enumerate(filenames):
+        file_path = os.path.join(bahn_data_dir, filename)
+        if read_route_index(file_path) is not None:
+            continue
+        print("Indexing file {}/{}: {}".format(file_index+1, len(filenames), filename))
+        build_route_index(file_path)
+
+    print("Indexing finished.")
+
+
+def read_route(data_path, start_station, end_station, usecols=None):
+    """Returns the rows of a single route from a merged data file, reading only the blocks listed in its route index.
+    `usecols` is passed to `pd.read_csv()`.
+
+    Returns None if the file has no current route index, see `read_route_index()`.
+    """
+
+    route_index = read_route_index(data_path)
+    if route_index is None:
+        return None
+
+    entries = route_index[(route_index['start_station'] == start_station) & (route_index['end_station'] == end_station)]
+
+    with open(data_path, 'rb') as data_file:
+        columns = next(csv.reader([data_file.readline().decode('utf-8')]))
+        blocks = []
+        for offset, length in zip(entries['offset'], entries['length']):
+            data_file.seek(offset)
+            blocks.append(data_file.read(length))
+
+    if not blocks:
+        return pd.DataFrame(columns=columns)
+
+    return pd.read_csv(io.BytesIO(b''.join(blocks)), header=None, names=columns, usecols=usecols)
+
+
 def merge_data(bahn_data_dir, climate_data_dir, map_path, output_path, prefix):
     """Merges bahn and climate data into one single file."""
 
@@ -201,7 +382,8 @@ def merge_data(bahn_data_dir, climate_data_dir, map_path, output_path, prefix):
 
     print("Merging {}...".format(prefix))
 
-    open_mode = 'w'
+    open_mode = 'wb'
+    route_index = []
     filenames = os.listdir(bahn_data_dir)
     lap = 0
     lap_total = len(filenames)
@@ -260,51 +442,79 @@ def merge_data(bahn_data_dir, climate_data_dir, map_path, output_path, prefix):
                         else:
                             bahn_data.loc[index, prefixed_col] = value
 
-        open(output_path, open_mode, encoding="utf-8").write(bahn_data.to_csv(index=False, header=open_mode=='w', line_terminator='\n'))
-        open_mode = 'a'
+        offset = 0 if open_mode == 'wb' else os.path.getsize(output_path)
+        content, file_route_index = to_indexed_csv(bahn_data, offset, header=open_mode=='wb')
+        with open(output_path, open_mode) as output:
+            output.write(content)
+        route_index.append(file_route_index)
+        open_mode = 'ab'
+
+    if route_index:
+        pd.concat(route_index).to_csv(get_route_index_path(output_path), index=False)
     
     print("Merging of {} finished.".format(prefix))
 
 
-def reduceCanceled(value):
-    return 0 if math.isnan(value) else 1
+def reduceCanceled(values):
+    return values.notna().astype(int)
+
+
+def read_route_chunks(file_path, start_station, end_station, usecols, chunk_size):
+    """Yields the rows of the given route from a merged data file in chunks.
+    Files with a route index are only read at the blocks of the route, all other files are scanned chunk by chunk.
+    """
+
+    route_data = read_route(file_path, start_station, end_station, usecols)
+    if route_data is not None:
+        yield route_data
+        return
+
+    for chunk in pd.read_csv(file_path, usecols=usecols, chunksize=chunk_size):
+        yield chunk.loc[(chunk['start_station'] == start_station) & (chunk['end_station'] == end_station)]
 
 
 def reduce(bahn_data_dir, output_path, start_station, end_station,
-    cl_columns=['tt_tu', 'rf_tu', 'r1', 'p_std', 'fx911', 'f', 'v_te002', 'v_te005', 'v_te010', 'v_te020', 'v_te050', 'v_te100'],
+    cl_columns=['tt_tu', 'rf_tu', 'r1', 'p_std', 'fx_911', 'f', 'v_te002', 'v_te005', 'v_te010', 'v_te020', 'v_te050', 'v_te100'],
     b_columns=['date','start_station','end_station','departure_at','arrival_at','train','delay','canceled'],
-    map={'canceled':reduceCanceled}
+    map={'canceled':reduceCanceled},
+    chunk_size=1000000
 ):
-    """Reduce the given bahn data to the given colums and line."""
+    """Reduce the given bahn data to the given colums and line.
+    Only the given columns are parsed and the result is appended chunk by chunk to the output file.
+    The functions in `map` are applied to whole columns (Series) of a chunk.
+    """
 
     prefixed_columns = []
     for column in list(cl_columns):
         for prefix in ['start', 'end']:
-            prefixed_columns += prefix+column
+            prefixed_columns.append('{}_{}'.format(prefix, column))
     columns = list(b_columns) + prefixed_columns
+    is_selected = lambda column: column in columns
 
-    data = None
+    rows = 0
+    header = True
 
-    filenames = os.listdir(bahn_data_dir)
-    for file_index, filename in enumerate(filenames):
-        print("Reducing file {}/{}: {}".format(file_index+1, len(filenames), filename))
-        file_path = os.path.join(bahn_data_dir, filename)
-        bahn_data = pd.read_csv(file_path)
-        
-        reduced_data = bahn_data.loc[bahn_data['start_station'] == start_station and bahn_data['end_station'] == end_station, columns]
+    with open(output_path, 'w', encoding='utf-8', newline='') as output:
+        filenames = [filename for filename in os.listdir(bahn_data_dir) if not is_route_index(filename)]
+        for file_index, filename in enumerate(filenames):
+            print("Reducing file {}/{}: {}".format(file_index+1, len(filenames), filename))
+            file_path = os.path.join(bahn_data_dir, filename)
 
-        for col, func in map.items():
-            reduced_data[col] = reduced_data[col].apply(func)
-        
-        if data is None:
-            data = reduced_data
-        else:
-            data = pd.concat(data, reduced_data)
-        
-        data.sort_values(by=['date', 'start_station', 'end_station'], inplace=True)
-        data.to_csv(output_path, index=False)
+            missing_columns = [column for column in columns if column not in read_header(file_path)]
+            if missing_columns:
+                raise ValueError("File {} lacks the columns {}.".format(file_path, ', '.join(missing_columns)))
 
-    print("Reducing finished.")
+            for chunk in read_route_chunks(file_path, start_station, end_station, is_selected, chunk_size):
+                reduced_data = chunk[columns]
+
+                for col, func in map.items():
+                    reduced_data[col] = func(reduced_data[col])
+
+                reduced_data.to_csv(output, index=False, header=header, line_terminator='\n')
+                header = False
+                rows += len(reduced_data.index)
+
+    print("Reducing finished. {} journeys written.".format(rows))
 
 
 def merge():
@@ -329,15 +539,18 @@ def merge():
     if args.number_of_partitions > 0:
         partition(args.bahn_data_dir, args.number_of_partitions)
     
+    if args.index_routes:
+        index_routes(args.bahn_data_dir)
+
     if args.reduce:
-        reduce(args.bahn_data_dir, args.output_path, 'Düsseldorf Hbf', 'Duisburg Hbf')
+        reduce(args.bahn_data_dir, args.output_path, args.start_station, args.end_station, chunk_size=args.chunk_size)
     
     # else:
         
     #     if args.annotate_climate:
     #         annotate_climate_data(args.climate_data_dir, map_path)
 
-    if args.bahn_data_dir is not None and args.number_of_partitions == 0:
+    if args.bahn_data_dir is not None and args.number_of_partitions == 0 and not args.reduce and not args.index_routes:
         output_path = args.output_path or os.path.join(args.bahn_data_dir, 'data_total.csv')
         merge_data(args.bahn_data_dir, args.climate_data_dir, map_path, output_path, prefix)
 
@@ -0,0 +1,41 @@
+import unittest
+from geodl.gazetteer import Gazetteer, normalize_name
+
+KOELN = (50.9430, 6.9589)
+BONN = (50.7320, 7.0970)
+MAINZ = (50.0012, 8.2590)
+
+
+class GazetteerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.gazetteer = Gazetteer([
+            ('Köln Hbf', *KOELN),
+            ('Bonn Hbf', *BONN),
+            ('Mainz Hbf', *MAINZ),
+        ])
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name('Frankfurt(Main)Hbf'), 'frankfurt main hauptbahnhof')
+
+    def test_exact_match(self):
+        self.assertEqual(self.gazetteer.lookup('Koeln Hauptbahnhof'), KOELN)
+
+    def test_fuzzy_match(self):
+        self.assertEqual(self.gazetteer.lookup('Koln Hbf'), KOELN)
+
+    def test_missing_station_stays_unresolved(self):
+        # a shared 'hauptbahnhof' must not make different cities similar
+        for name in ['Essen Hbf', 'Kiel Hbf', 'Ulm Hbf']:
+            self.assertIsNone(self.gazetteer.lookup(name), name)
+
+    def test_tie_is_won_by_first_entry(self):
+        # both entries have the distinctive name 'neustadt' and are equally similar to the query
+        entries = [('Neustadt Hbf', *KOELN), ('Neustadt Haltepunkt', *BONN)]
+        for ordered_entries in [entries, entries[::-1]]:
+            gazetteer = Gazetteer(ordered_entries)
+            self.assertEqual(gazetteer.lookup('Neustat Hbf'), ordered_entries[0][1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
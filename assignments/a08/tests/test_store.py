@@ -0,0 +1,35 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from features.store import INPUT_COLUMNS, LABELS, load_feature_frame, read_labeled_frame
+
+
+class FeatureStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.data_path = os.path.join(self.directory.name, 'data.csv')
+
+        random = np.random.default_rng(0)
+        data = pd.DataFrame(random.normal(size=(200, len(INPUT_COLUMNS))), columns=INPUT_COLUMNS)
+        data['delay'] = random.integers(0, 30, size=200).astype(float)
+        data['canceled'] = random.integers(0, 3, size=200).astype(float)
+        # missing values in columns that are no features must not remove rows
+        data['train'] = np.where(random.random(200) < 0.3, None, 'ICE')
+        data.loc[random.random(200) < 0.1, INPUT_COLUMNS[0]] = np.nan
+        data.loc[random.random(200) < 0.1, 'delay'] = np.nan
+        data.to_csv(self.data_path, index=False)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_same_rows_with_and_without_store(self):
+        for label in LABELS:
+            csv_input, csv_output = read_labeled_frame(self.data_path, INPUT_COLUMNS, label)
+            store_input, store_output = load_feature_frame(self.data_path, INPUT_COLUMNS, label, self.directory.name)
+
+            self.assertEqual(len(csv_input.index), len(store_input.index), label)
+            np.testing.assert_allclose(csv_input.to_numpy(dtype=np.float32), store_input.to_numpy())
+            np.testing.assert_allclose(csv_output.to_numpy(dtype=np.float32), store_output.to_numpy())
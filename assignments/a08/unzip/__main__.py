@@ -1,8 +1,17 @@
 import argparse
+import fnmatch
+import multiprocessing
 import os
 import zipfile
 from tqdm import tqdm
 
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got {}".format(value))
+    return number
+
+
 def parse_arguments():
     parser = argparse.ArgumentParser(
         "Unzip a lot of files at once.")
@@ -15,12 +24,73 @@ def parse_arguments():
     parser.add_argument('-r', '--recursive',
         help="If set, all zip files in zip-dir and all its subdirectories are recursively decoded.",
         action='store_true')
+    parser.add_argument('-p', '--patterns',
+        help="Only extract zip members matching one of the given glob patterns (e.g. 'produkt_*' 'Metadaten_Geographie_*'). All members are extracted if unset.",
+        nargs='*',
+        default=[])
+    parser.add_argument('-f', '--flat',
+        help="Extract the members directly into the output directory instead of creating a directory per zip file.",
+        action='store_true')
+    parser.add_argument('-j', '--jobs',
+        help="Number of processes extracting zip files in parallel. Number of CPUs by default.",
+        type=positive_int,
+        default=os.cpu_count())
 
     return parser.parse_args()
 
 
-def unzip_dir(zip_dir, output_dir):
-    """Unzip all zip files in a single directory.
+def is_selected(member_name, patterns):
+    """Returns True if the basename of the zip member matches one of the glob patterns or no patterns are given."""
+
+    if member_name.endswith('/'):
+        return False
+    basename = os.path.basename(member_name)
+    return not patterns or any(fnmatch.fnmatch(basename, pattern) for pattern in patterns)
+
+
+def is_up_to_date(zip_file_path, output_paths):
+    """Returns True if all output files exist and are newer than the zip file. False if there are no output files."""
+
+    if not output_paths:
+        return False
+    zip_mtime = os.path.getmtime(zip_file_path)
+    return all(os.path.isfile(path) and os.path.getmtime(path) >= zip_mtime for path in output_paths)
+
+
+def unzip_file(job):
+    """Extract the selected members of a single zip file.
+
+    Parameters
+    ----------
+    job : (zip_file_path : str, output_zip_dir : str, patterns : str[])
+          Zip file, directory to extract into and glob patterns selecting the members to extract.
+
+    Returns
+    -------
+    Number of extracted members. 0 if the zip file was skipped, because its outputs are up to date.
+    None if the zip file contains no selected members.
+    """
+
+    zip_file_path, output_zip_dir, patterns = job
+
+    with zipfile.ZipFile(zip_file_path) as zip_file:
+        members = [member for member in zip_file.infolist() if is_selected(member.filename, patterns)]
+        if not members:
+            return None
+        output_paths = [os.path.join(output_zip_dir, member.filename) for member in members]
+
+        if is_up_to_date(zip_file_path, output_paths):
+            return 0
+
+        os.makedirs(output_zip_dir, exist_ok=True)
+        for member in members:
+            zip_file.extract(member, output_zip_dir)
+
+    return len(members)
+
+
+def get_jobs(zip_dir, output_dir, patterns, flat):
+    """Returns an extraction job for every zip file in a single directory.
 
     Parameters
     ----------
@@ -28,32 +98,68 @@ def unzip_dir(zip_dir, output_dir):
               Directory of which all contained zip files are unzipped.
     output_dir : str
                  Directory in which all unzipped file directories will be placed.
+    patterns : str[]
+               Glob patterns selecting the members to extract.
+    flat : bool
+           If true, members are extracted into `output_dir` directly.
     """
 
     zip_files = [file for file in os.listdir(zip_dir) 
         if os.path.isfile(os.path.join(zip_dir, file)) and
         os.path.splitext(file)[1] == '.zip']
 
-    for zip_file_name in tqdm(zip_files):
-        output_zip_dir = os.path.join(output_dir, os.path.splitext(zip_file_name)[0])
-        zip_file_path = os.path.join(zip_dir, zip_file_name)
-        
-        if not os.path.exists(output_zip_dir):
-            os.makedirs(output_zip_dir)
+    jobs = []
+    for zip_file_name in zip_files:
+        output_zip_dir = output_dir if flat else os.path.join(output_dir, os.path.splitext(zip_file_name)[0])
+        jobs.append((os.path.join(zip_dir, zip_file_name), output_zip_dir, patterns))
+
+    return jobs
+
+
+def run_jobs(jobs, number_of_processes):
+    """Extracts the zip files of all jobs with a process pool."""
 
-        zip_file = zipfile.ZipFile(zip_file_path)
-        zip_file.extractall(output_zip_dir)
+    with multiprocessing.Pool(number_of_processes) as pool:
+        extracted = list(tqdm(pool.imap_unordered(unzip_file, jobs), total=len(jobs)))
+
+    skipped = extracted.count(0)
+    without_members = extracted.count(None)
+    print("Extracted {} files from {} zip files, {} zip files up to date, {} zip files without selected members.".format(
+        sum(count for count in extracted if count is not None), len(jobs) - skipped - without_members, skipped, without_members))
+
+
+def unzip_dir(zip_dir, output_dir, patterns=None, flat=False, jobs=None):
+    """Unzip all zip files in a single directory.
+
+    Parameters
+    ----------
+    zip_dir : str
+              Directory of which all contained zip files are unzipped.
+    output_dir : str
+                 Directory in which all unzipped file directories will be placed.
+    patterns : str[]
+               Glob patterns selecting the members to extract. All members are extracted if empty or None.
+    flat : bool
+           If true, members are extracted into `output_dir` directly.
+    jobs : int
+           Number of processes. Number of CPUs if None.
+    """
+
+    run_jobs(get_jobs(zip_dir, output_dir, patterns or [], flat), jobs)
 
 
 def unzip():
     args = parse_arguments()
     
     if not args.recursive:
-        unzip_dir(args.zip_dir, args.output_dir or args.zip_dir)
+        jobs = get_jobs(args.zip_dir, args.output_dir or args.zip_dir, args.patterns, args.flat)
     else:
-        for dir_path, _, _ in tqdm(os.walk(args.zip_dir, topdown=False)):
+        jobs = []
+        for dir_path, _, _ in os.walk(args.zip_dir, topdown=False):
             output_dir = args.output_dir or dir_path
-            unzip_dir(dir_path, output_dir)
+            jobs += get_jobs(dir_path, output_dir, args.patterns, args.flat)
+
+    run_jobs(jobs, args.jobs)
 
 if __name__ == '__main__':
     unzip()